@@ -1,7 +1,48 @@
 import numpy as np
 import warnings
-  
+from pyEMG.segments import SegmentIndex
+
+def _complement(segments, n_samples):
+    """Returns the (start, stop) segments of [0, n_samples) not covered by
+    segments."""
+    segments = segments[np.argsort(segments[:, 0], kind='mergesort')]
+    starts = np.hstack(([0], segments[:, 1]))
+    stops = np.hstack((segments[:, 0], [n_samples]))
+    # Covered up to each gap (segments may be adjacent)
+    starts = np.maximum.accumulate(starts)
+    keep = stops > starts
+    return np.column_stack((starts[keep], stops[keep]))
+
+def segment_indices(segments):
+    """Returns the sample indices of a list of (start, stop) segments."""
+    if len(segments) == 0:
+        return np.zeros(0, dtype=int)
+    return np.concatenate([np.arange(start, stop) for start, stop in segments])
+
+def segment_data(data, segments):
+    """Returns the concatenation of data over (start, stop) segments."""
+    if len(segments) == 0:
+        return data[:0]
+    if len(segments) == 1:
+        return data[segments[0][0]:segments[0][1]]
+    return np.concatenate([data[start:stop] for start, stop in segments])
+
 class MovementCrossValidation(object):
+    """Cross-validation over movement repetitions.
+
+    Folds are stored as arrays of contiguous (start, stop) segments, so that
+    their memory does not depend on the number of samples.
+
+    Attributes
+    ----------
+
+    train_segments, test_segments : list of arrays, shape = (n_segments, 2)
+        Training and testing segments of each fold.
+    train_instances, test_instances : list of arrays
+        Training and testing sample indices of each fold (built on first
+        access and kept until the next fit; see fold_indices for the
+        indices of a single fold).
+    """
     
     def __init__(self, n_reps, n_folds, n_trn, n_mov=None):
         self.n_folds = n_folds
@@ -10,8 +51,9 @@ class MovementCrossValidation(object):
         self.n_tst = n_reps - n_trn
         self.n_mov = n_mov
         self._assert_parameters()
-        self.train_instances = None
-        self.test_instances = None
+        self.train_segments = None
+        self.test_segments = None
+        self._instances = dict()
         
     
     def _assert_parameters(self):
@@ -24,11 +66,11 @@ class MovementCrossValidation(object):
             warnings.warn('Cross-validation configuration is ill-defined. Picking one at random.')
             self._is_ill_defined = True
             
-    def _segpoints(self, stimulus):
+    def _segpoints(self, stimulus, index=None):
         """Find segmentation points."""
-        stim_diff = np.diff(stimulus)
-        changepoints = np.nonzero(stim_diff)[0]
-        changepoints = np.hstack([0, changepoints, stimulus.size])
+        if index is None:
+            index = SegmentIndex(stimulus)
+        changepoints = np.hstack([0, index.label_changes() - 1, index.n_samples])
         changepoints_diff = np.diff(changepoints)
         segpoints = changepoints[:-1] + np.fix(changepoints_diff/2)
         segpoints = segpoints[0::2] # Sub-sample every 2 points
@@ -44,15 +86,21 @@ class MovementCrossValidation(object):
             ind = ind[0:-1]
         return x[ind]
         
-    def fit(self, stimulus):
+    def fit(self, stimulus, index=None):
+        """Finds the training and testing instances of each fold. A
+        precomputed segment index of the stimulus (see
+        Dataset.segment_index) can be given to avoid rescanning it."""
         stimulus = np.asarray(stimulus)
         if stimulus.ndim == 2:
             warnings.warn("Stimulus is 2-dimensional. Squeezing")
             stimulus = np.squeeze(stimulus)
-        self.n_mov = np.unique(stimulus).size-1 if self.n_mov is None else self.n_mov
-        segpoints = self._segpoints(stimulus)
-        self.train_instances = []
-        self.test_instances = []
+        if index is None:
+            index = SegmentIndex(stimulus)
+        self.n_mov = np.unique(index.label).size-1 if self.n_mov is None else self.n_mov
+        segpoints = self._segpoints(stimulus, index)
+        self._instances = dict()
+        self.train_segments = []
+        self.test_segments = []
         if self._is_ill_defined is True:
             raise NotImplementedError
         else:
@@ -62,30 +110,64 @@ class MovementCrossValidation(object):
             points = np.asarray(points, dtype=int)
     
             for fold in range(0, self.n_folds):
-                tst_ind = []
+                tst_seg = []
                 for mvmnt in range(self.n_mov):
-                    if (fold+1)*self.n_tst is not self.n_reps:
-                        tst_ind.extend(range(points[fold*self.n_tst,mvmnt],points[(fold+1)*self.n_tst,mvmnt]))
+                    if (fold+1)*self.n_tst != self.n_reps:
+                        tst_seg.append((points[fold*self.n_tst,mvmnt],points[(fold+1)*self.n_tst,mvmnt]))
                     else:
-                        if mvmnt is not self.n_mov-1:
-                            tst_ind.extend(range(points[fold*self.n_tst,mvmnt], points[0,mvmnt+1]))
+                        if mvmnt != self.n_mov-1:
+                            tst_seg.append((points[fold*self.n_tst,mvmnt], points[0,mvmnt+1]))
                         else:
-                            tst_ind.extend(range(points[fold*self.n_tst,mvmnt], stimulus.size))
-                tst_ind = np.asarray(tst_ind)
-                
-                tr_ind = np.arange(stimulus.size)
-                tr_ind = np.delete(tr_ind, tr_ind[tst_ind])
-                self.train_instances.append(tr_ind)
-                self.test_instances.append(tst_ind) 
-    
-    def get_data(self, data, fold):
-        """Return training and testing data for a specified fold"""
-        
+                            tst_seg.append((points[fold*self.n_tst,mvmnt], stimulus.size))
+                tst_seg = np.asarray(tst_seg, dtype=int).reshape((-1, 2))
+                tst_seg = tst_seg[tst_seg[:, 1] > tst_seg[:, 0]]
+
+                self.train_segments.append(_complement(tst_seg, stimulus.size))
+                self.test_segments.append(tst_seg)
+
+    @property
+    def train_instances(self):
+        return self._all_indices('train')
+
+    @property
+    def test_instances(self):
+        return self._all_indices('test')
+
+    def _all_indices(self, subset):
+        segments = self._segments(subset)
+        if segments is None:
+            return None
+        if subset not in self._instances:
+            self._instances[subset] = [segment_indices(s) for s in segments]
+        return self._instances[subset]
 
-        data_tr = data[self.train_instances[fold]]
-        data_ts = data[self.test_instances[fold]]
+    def _segments(self, subset):
+        if subset == 'train':
+            return self.train_segments
+        if subset == 'test':
+            return self.test_segments
+        raise ValueError("subset must be 'train' or 'test'.")
+
+    def fold_indices(self, fold, subset='train'):
+        """Returns the training (or testing) sample indices of a fold,
+        built from its segments only."""
+        return segment_indices(self._segments(subset)[fold])
+
+    def get_data(self, data, fold):
+        """Return training and testing data for a specified fold. Data are
+        concatenated from slices of the segments (a view if there is a
+        single segment)."""
+        data_tr = segment_data(data, self.train_segments[fold])
+        data_ts = segment_data(data, self.test_segments[fold])
         return (data_tr, data_ts)
 
+    def iter_data(self, data, fold, subset='train'):
+        """Yields the data of the training (or testing) segments of a fold
+        as views, without copying."""
+        segments = self.train_segments[fold] if subset == 'train' else self.test_segments[fold]
+        for start, stop in segments:
+            yield data[start:stop]
+
                        
 ## TESTS
 #points = []   
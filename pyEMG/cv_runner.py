@@ -0,0 +1,110 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import pandas as pd
+from pyEMG.cross_validation import segment_data
+
+# Arrays memory-mapped in worker processes, by name
+_SHARED = dict()
+
+def _attach(paths):
+    """Pool initializer: maps the data files into the worker (read-only)."""
+    for name, path in paths.items():
+        _SHARED[name] = np.load(path, mmap_mode='r')
+
+def _run_task(task):
+    """Fits and scores a model on one fold, reading the shared data."""
+    return _evaluate(_SHARED['X'], _SHARED['y'], *task)
+
+def _evaluate(X, y, make_model, scoring, fold, params, train, test):
+    model = make_model(**params)
+    t0 = time.time()
+    model.fit(segment_data(X, train), segment_data(y, train))
+    fit_time = time.time() - t0
+    y_test = segment_data(y, test)
+    y_pred = model.predict(segment_data(X, test))
+    # Models with lagged inputs (e.g. WienerFilter) do not predict the
+    # first samples
+    y_test = y_test[len(y_test) - len(y_pred):]
+    record = dict(fold=fold, fit_time=fit_time)
+    record.update(params)
+    for name, score in scoring.items():
+        record[name] = score(y_test, y_pred)
+    return record
+
+def cross_validate(make_model, X, y, cv, scoring, param_grid=None, n_jobs=None):
+    """Evaluates a model on every cross-validation fold, for every
+    combination of parameters, on a pool of processes.
+
+    X and y are written once to temporary files, which workers map
+    read-only (pages are shared through the OS cache); each task only
+    receives the (start, stop) segments of its fold, from which workers
+    slice the data.
+
+    Parameters
+    ----------
+
+    make_model : callable
+        Returns a new model given parameters as keyword arguments, e.g. a
+        class or functools.partial. The model must implement fit(X, y) and
+        predict(X). It is sent to workers, hence it must be picklable.
+    X : array, shape = (n_samples, n_features)
+    y : array, shape = (n_samples,) or (n_samples, n_outputs)
+    cv : MovementCrossValidation
+        Fitted cross-validation object.
+    scoring : callable or dict of callables
+        Metrics score(y_true, y_pred). If a model predicts fewer samples
+        than given, its predictions are aligned to the end of y_true.
+    param_grid : dict, optional
+        Lists of values of model parameters; all combinations are evaluated.
+    n_jobs : int, optional
+        Number of processes (all CPUs if None). With n_jobs=1 tasks are run
+        in the calling process.
+
+    Returns
+    -------
+
+    results : DataFrame
+        One row per fold and parameter combination, with columns fold, the
+        parameters, the scores and fit_time.
+    """
+    X = np.ascontiguousarray(X)
+    y = np.ascontiguousarray(y)
+    if not callable(scoring):
+        scoring = dict(scoring)
+    else:
+        scoring = {'score': scoring}
+    param_grid = dict() if param_grid is None else param_grid
+    names = sorted(param_grid)
+    grid = [dict(zip(names, values))
+            for values in itertools.product(*[param_grid[name] for name in names])]
+    tasks = [(make_model, scoring, fold, params, train, test)
+             for fold, (train, test) in enumerate(zip(cv.train_segments, cv.test_segments))
+             for params in grid]
+
+    n_jobs = cpu_count() if n_jobs is None else n_jobs
+    if n_jobs == 1 or len(tasks) == 0:
+        records = [_evaluate(X, y, *task) for task in tasks]
+    else:
+        folder = tempfile.mkdtemp(prefix='pyEMG_cv_')
+        try:
+            paths = dict()
+            for name, x in [('X', X), ('y', y)]:
+                paths[name] = os.path.join(folder, name + '.npy')
+                np.save(paths[name], x)
+            pool = Pool(processes=min(n_jobs, len(tasks)), initializer=_attach, initargs=(paths,))
+            try:
+                records = pool.map(_run_task, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    return pd.DataFrame(records, columns=['fold'] + names + list(scoring) + ['fit_time'])
@@ -86,6 +86,10 @@ class CyberGlove(object):
         baud_rate : int, optional, default: 115200
             Baud rate.
 
+        glove_filter : object, optional, default: None
+            Online filter (e.g. pyEMG.filters_online.ButterworthFilter)
+            applied to each measurement before it is buffered.
+
 
         Attributes
         ----------
@@ -95,7 +99,8 @@ class CyberGlove(object):
     """
 
     def __init__(self, n_df=None, s_port=None, baud_rate=115200,
-                 buffered=True, buf_size=1., calibration_file=None):
+                 buffered=True, buf_size=1., calibration_file=None,
+                 glove_filter=None):
 
         # If n_df is not given assume 18-DOF Cyberglove but issue warning
         if n_df == None:
@@ -119,6 +124,7 @@ class CyberGlove(object):
         self.buffered = buffered
         self.buf_size = buf_size
         self.calibration_file = calibration_file
+        self.glove_filter = glove_filter
 
 
         self.__srate = 100 # Hardware sampling rate. TODO: Double-check this is correct
@@ -158,6 +164,8 @@ class CyberGlove(object):
         self.__networking = True
         self.si.open()
         self._startTime_ = timeit.default_timer()
+        if self.glove_filter is not None:
+            self.glove_filter.reset()
         self.si.flushOutput()
         self.si.flushInput()
         threading.Thread(target=self.networking, args=()).start()
@@ -177,6 +185,8 @@ class CyberGlove(object):
             data = self.raw_measurement()
             if self.calibration_ is True:
                 data = calibrate_data(data, self.calibration_offset_, self.calibration_gain_)
+            if self.glove_filter is not None:
+                data = self.glove_filter.filter(data)
             timestamp = np.asarray([timeit.default_timer()])
 
             if self.buffered is True:
@@ -1,9 +1,82 @@
 import numpy as np
 from bin_parm import BinParm
 from scipy.signal import butter, lfilter, filtfilt
+from pyEMG.filters_utils import (allocate_output, butter_sos, filter_channels,
+                                 sosfilt_chunked, sosfiltfilt_chunked)
+from pyEMG.resampling import resample
+from pyEMG.segments import SegmentIndex
+
+# Repetition vector matching each label vector
+_REPETITIONS = {'stimulus': 'repetition', 'restimulus': 'rerepetition'}
+
+# Number of columns each sensor contributes to a modality, by channel layout
+_SIGNALS_PER_SENSOR = {'emg': 1, 'raw': 3, 'quat': 4, 'pry': 3}
+_INDEX_MAPS = dict()
+
+def _sensor_index_maps(n_sensors):
+    """Returns the per-sensor column maps of every channel layout. Row i of
+    each map holds the columns of sensor i. Maps are computed once for each
+    number of sensors and shared between datasets."""
+    if n_sensors not in _INDEX_MAPS:
+        _INDEX_MAPS[n_sensors] = dict(
+            (layout, np.arange(n_sensors*n).reshape((n_sensors, n)))
+            for layout, n in _SIGNALS_PER_SENSOR.items())
+    return _INDEX_MAPS[n_sensors]
+
+def _as_slice(indices):
+    """Returns a slice equivalent to indices if they are evenly spaced and
+    increasing (so that indexing returns a view), otherwise the indices."""
+    if indices.size == 0:
+        return indices
+    step = indices[1] - indices[0] if indices.size > 1 else 1
+    if step > 0 and np.all(np.diff(indices) == step):
+        return slice(int(indices[0]), int(indices[-1]) + 1, int(step))
+    return indices
+
+class _SelectedSignal(object):
+    """Sensor data attribute to which the channel selection of the dataset
+    is applied lazily, i.e. only when the data are read.
+
+    Assigning to the attribute stores the array as is; it is assumed to hold
+    the channels of the currently selected electrodes. Selections that are
+    not views (unevenly spaced channels) are gathered once and cached until
+    the data or the selection change."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        signals = obj.__dict__.get('_signals', {})
+        if self.name not in signals:
+            raise AttributeError(self.name)
+        index = obj._channel_index.get(self.name)
+        x = signals[self.name]
+        if index is None:
+            return x
+        if isinstance(index, slice):
+            return x[:, index]
+        cache = obj.__dict__.setdefault('_selected_signals', {})
+        if self.name not in cache:
+            cache[self.name] = x[:, index]
+        return cache[self.name]
+
+    def __set__(self, obj, value):
+        obj.__dict__.setdefault('_selected_signals', {}).pop(self.name, None)
+        obj.__dict__.setdefault('_signals', {})[self.name] = value
+        obj.__dict__.setdefault('_signal_electrodes', {})[self.name] = \
+            obj.__dict__.get('_selected_electrodes')
+        obj.__dict__.setdefault('_channel_index', {}).pop(self.name, None)
 
 class Dataset(object):
 
+    emg = _SelectedSignal('emg')
+    acc = _SelectedSignal('acc')
+    gyro = _SelectedSignal('gyro')
+    mag = _SelectedSignal('mag')
+    imu = _SelectedSignal('imu')
+
     def __init__(self, data_dict, imu_type=None):
         self.imuType = imu_type
         if data_dict.has_key('emg'):
@@ -33,11 +106,30 @@ class Dataset(object):
         self.electrodes = self._get_active_electrodes()
         self.sRate = {'emg':2e3, 'acc':2e3, 'gyro':2e3, 'mag':2e3, 'glove':2e3}
 
+    def _has(self, name):
+        """Returns whether the dataset holds name, without reading (and
+        selecting the channels of) sensor data."""
+        return name in self.__dict__.get('_signals', {}) or name in self.__dict__
+
     def _get_active_electrodes(self):
         var = np.var(self.emg, axis = 0)
         active = np.where(var > 0.)
         return active
 
+    def segment_index(self, labels='stimulus'):
+        """Returns the run-length segment index (see segments.SegmentIndex) of
+        a label vector, split by the matching repetition vector if present.
+        The index is built once and reused until the labels are replaced."""
+        x = getattr(self, labels)
+        rep_name = _REPETITIONS.get(labels)
+        rep = getattr(self, rep_name, None) if rep_name is not None else None
+        cache = self.__dict__.setdefault('_segment_indexes', {})
+        if labels in cache and cache[labels][0] is x and cache[labels][1] is rep:
+            return cache[labels][2]
+        index = SegmentIndex(x, rep)
+        cache[labels] = (x, rep, index)
+        return index
+
     def set_glove_sensors(self, sensors):
         self.glove_sensors = sensors
         self.glove = self.glove[:,sensors]
@@ -46,79 +138,165 @@ class Dataset(object):
         """Transform glove data into another representation. A mapping matrix A is required."""
         self.glove = np.dot(self.glove, A)
 
+    def _channel_layout(self, name):
+        """Returns the channel layout of a sensor modality, or None if it is
+        not subject to electrode selection."""
+        if name == 'emg':
+            return 'emg'
+        if name in ('acc', 'gyro', 'mag') and self.imuType == 'raw':
+            return 'raw'
+        if name == 'imu' and self.imuType in ('pry', 'quat'):
+            return self.imuType
+        return None
+
     def set_electrodes(self, electrodes, imu_type='quat'):
-        """Select a subset of sensors."""
-        self.electrodes = np.asarray(electrodes)
-        if hasattr(self, 'emg'):
-            self.emg = self.emg[:,electrodes]
-        if self.imuType == 'raw':
-            indices = np.zeros(0, dtype = int)
-            for electrode in electrodes:
-                indices = np.append(indices, np.arange(electrode*3,(electrode+1)*3))
-            if hasattr(self, 'acc'):
-                self.acc = self.acc[:, indices]
-            if hasattr(self, 'gyro'):
-                self.gyro = self.gyro[:, indices]
-            if hasattr(self, 'mag'):
-                self.mag = self.mag[:, indices]
-        elif self.imuType == 'pry':
-            indices = np.zeros(0, dtype = int)
-            for electrode in electrodes:
-                indices = np.append(indices, np.arange(electrode*3,(electrode+1)*3))
-            self.imu = self.imu[:, indices]
-        elif self.imuType == 'quat':
-            indices = np.zeros(0, dtype = int)
-            for electrode in electrodes:
-                indices = np.append(indices, np.arange(electrode*4,(electrode+1)*4))
-            self.imu = self.imu[:, indices]
+        """Select a subset of sensors.
+
+        The selection is recorded rather than applied: sensor data are only
+        indexed when read, through a slice (i.e. a view, without copying)
+        whenever the selected channels are evenly spaced. Electrodes always
+        refer to the sensors of the original recording, hence successive
+        calls replace the previous selection."""
+        electrodes = np.asarray(electrodes, dtype=int).reshape(-1)
+        channel_index = dict()
+        for name, x in self.__dict__.get('_signals', {}).items():
+            layout = self._channel_layout(name)
+            if layout is None:
+                continue
+            n_sensors = x.shape[1] // _SIGNALS_PER_SENSOR[layout]
+            stored = self._signal_electrodes[name]
+            if stored is None:
+                sensors = electrodes
+            else:
+                # Data were stored after a previous selection
+                position = dict((e, i) for i, e in enumerate(stored))
+                try:
+                    sensors = np.asarray([position[e] for e in electrodes], dtype=int)
+                except KeyError:
+                    raise ValueError('Electrodes not available in {} data.'.format(name))
+            index = _sensor_index_maps(n_sensors)[layout][sensors].reshape(-1)
+            channel_index[name] = _as_slice(index)
+        self.electrodes = electrodes
+        self._selected_electrodes = electrodes
+        self.__dict__.setdefault('_channel_index', {}).update(channel_index)
+        self.__dict__.pop('_selected_signals', None)
 
 class DatasetRaw(Dataset):
 
-    def __init__(self, data_dict, imu_type):
+    def __init__(self, data_dict, imu_type, sRate=None):
+        """sRate is an optional dictionary with the sampling frequency of
+        each modality, e.g. {'imu': 148.148, 'glove': 100.}. Modalities not
+        included are assumed to be sampled at 2 kHz."""
         super(DatasetRaw, self).__init__(data_dict, imu_type)
-        self.sRate = {'emg':2e3, 'acc':2e3, 'gyro':2e3, 'mag':2e3, 'imu':2e3, 'glove':2e3} # TODO FIX THIS
+        self.sRate = {'emg':2e3, 'acc':2e3, 'gyro':2e3, 'mag':2e3, 'imu':2e3, 'glove':2e3}
+        if sRate is not None:
+            self.sRate.update(sRate)
+
+    def resample(self, sRate, modalities=None):
+        """Bring modalities onto a common timebase by polyphase resampling.
+
+        Parameters
+        ----------
+
+        sRate : float
+            Target sampling frequency (Hz).
+
+        modalities : list of str, optional
+            Modalities to be resampled. By default, all modalities not
+            sampled at sRate. Label vectors (stimulus, repetition etc.) are
+            sampled at the EMG rate, hence they are resampled (by picking the
+            nearest preceding sample) along with EMG data.
+        """
+        if modalities is None:
+            modalities = [m for m in self.sRate if self.sRate[m] != sRate]
+        for modality in modalities:
+            if not self._has(modality) or self.sRate[modality] == sRate:
+                continue
+            x = getattr(self, modality)
+            setattr(self, modality, resample(x, self.sRate[modality], sRate))
+            if modality == 'emg':
+                for labels in ['stimulus', 'restimulus', 'repetition', 'rerepetition']:
+                    if self._has(labels):
+                        y = getattr(self, labels)
+                        n_out = self.emg.shape[0]
+                        idx = (np.arange(n_out) * (self.sRate['emg'] / sRate)).astype(int)
+                        setattr(self, labels, y[np.minimum(idx, y.shape[0] - 1)])
+            self.sRate[modality] = sRate
+
+    def emg_filter(self,order = 4, lowcut = 10., highcut = 500., zero_phase = False,
+                   chunk_size = None, out = None, n_jobs = 1):
+        """Band-pass filtering of EMG data (IIR butterworth filter).
+
+        If chunk_size is given, data are processed in chunks of chunk_size
+        samples, so that memory requirements do not depend on the recording
+        length (EMG data and out can be memory-mapped). out is either an
+        array of the same shape as the EMG data or the path of a .npy file to
+        be created. Zero-phase filtering is the same as filtfilt. Channels
+        are filtered in n_jobs threads (all CPUs if None)."""
+        if chunk_size is None and out is None:
+            nyq = 0.5 * self.sRate['emg']
+            low = lowcut/nyq
+            high = highcut/nyq
+            b, a = butter(order, [low, high], btype = 'band')
+            filt = filtfilt if zero_phase else lfilter
+            def _filter(x, out):
+                out[...] = filt(b, a, x, axis=0)
+            self.emg = filter_channels(_filter, self.emg, n_jobs=n_jobs)
+        else:
+            sos = butter_sos(order, self.sRate['emg'], lowcut=lowcut, highcut=highcut)
+            filt = sosfiltfilt_chunked if zero_phase else sosfilt_chunked
+            self.emg = self._filter_chunked(filt, sos, self.emg, chunk_size, out, n_jobs)
 
-    def emg_filter(self,order = 4, lowcut = 10., highcut = 500.):
-        nyq = 0.5 * self.sRate['emg']
-        low = lowcut/nyq
-        high = highcut/nyq
-        b, a = butter(order, [low, high], btype = 'band')
-        self.emg = lfilter(b=b, a=a, x=self.emg, axis=0)
+    def glove_filter(self, order = 4, highcut = 2, chunk_size = None, out = None, n_jobs = 1):
+        """Zero-phase low-pass filtering of glove data (IIR butterworth
+        filter). See emg_filter for chunk_size, out and n_jobs."""
+        if chunk_size is None and out is None:
+            nyq = 0.5 * self.sRate['glove']
+            high = highcut/nyq
+            b, a = butter(N=order, Wn = high, btype = 'lowpass')
+            def _filter(x, out):
+                out[...] = filtfilt(b=b, a=a, x=x, axis=0)
+            self.glove = filter_channels(_filter, self.glove, n_jobs=n_jobs)
+        else:
+            sos = butter_sos(order, self.sRate['glove'], highcut=highcut)
+            self.glove = self._filter_chunked(sosfiltfilt_chunked, sos, self.glove,
+                                              chunk_size, out, n_jobs)
 
-    def glove_filter(self, order = 4, highcut = 2):
-        nyq = 0.5 * self.sRate['glove']
-        high = highcut/nyq
-        b, a = butter(N=order, Wn = high, btype = 'lowpass')
-        self.glove = filtfilt(b=b, a=a, x=self.glove, axis=0)
+    def _filter_chunked(self, filt, sos, x, chunk_size, out, n_jobs):
+        """Chunked filtering of blocks of channels in parallel."""
+        chunk_size = 65536 if chunk_size is None else chunk_size
+        def _filter(x, out):
+            filt(sos, x, out=out, chunk_size=chunk_size)
+        return filter_channels(_filter, x, out=allocate_output(x, out), n_jobs=n_jobs)
 
 class DatasetBinned(Dataset):
 
     def __init__(self, datasetraw, binparm):
-        if hasattr(datasetraw, 'emg'):
+        # Binned data hold the channels of the electrodes selected in datasetraw
+        self._selected_electrodes = getattr(datasetraw, '_selected_electrodes', None)
+        if datasetraw._has('emg'):
             self.emg = self._bin(datasetraw.emg, binparm, datasetraw.sRate['emg'])
-        if hasattr(datasetraw, 'acc'):
+        if datasetraw._has('acc'):
             self.acc = self._bin(datasetraw.acc, binparm, datasetraw.sRate['acc'])
-        if hasattr(datasetraw, 'gyro'):
+        if datasetraw._has('gyro'):
             self.gyro = self._bin(datasetraw.gyro, binparm, datasetraw.sRate['gyro'])
-        if hasattr(datasetraw, 'mag'):
+        if datasetraw._has('mag'):
             self.mag = self._bin(datasetraw.mag, binparm, datasetraw.sRate['mag'])
-        if hasattr(datasetraw, 'imu'):
+        if datasetraw._has('imu'):
             self.imu = self._bin(datasetraw.imu, binparm, datasetraw.sRate['imu'])
-        if hasattr(datasetraw, 'glove'):
+        if datasetraw._has('glove'):
             self.glove = self._bin(datasetraw.glove, binparm, datasetraw.sRate['glove'])
-        if hasattr(datasetraw, 'stimulus'):
-            self.stimulus = self._bin_integer(datasetraw.stimulus, binparm, datasetraw.sRate['emg'])
-        if hasattr(datasetraw, 'restimulus'):
-            self.restimulus = self._bin_integer(datasetraw.restimulus, binparm, datasetraw.sRate['emg'])
-        if hasattr(datasetraw, 'repetition'):
-            self.repetition = self._bin_integer(datasetraw.repetition, binparm, datasetraw.sRate['emg'])
-        if hasattr(datasetraw, 'rerepetition'):
+        for labels in ['stimulus', 'restimulus', 'repetition']:
+            if datasetraw._has(labels):
+                setattr(self, labels, self._bin_integer(getattr(datasetraw, labels), binparm,
+                        datasetraw.sRate['emg'], datasetraw.segment_index(labels)))
+        if datasetraw._has('rerepetition'):
             self.rerepetition = self._bin(datasetraw.rerepetition, binparm, datasetraw.sRate['emg'])
-        if hasattr(datasetraw, 'exercise'):
+        if datasetraw._has('exercise'):
             self.exercise = datasetraw.exercise
-        if hasattr(datasetraw, 'subject'):
+        if datasetraw._has('subject'):
             self.subject = datasetraw.subject
-        if hasattr(datasetraw, 'electrodes'):
+        if datasetraw._has('electrodes'):
             self.electrodes = datasetraw.electrodes
 
     def _bin(self, x, binparm, sRate):
@@ -140,8 +318,13 @@ class DatasetBinned(Dataset):
             en += win_inc
         return y
 
-    def _bin_integer(self, x, binparm, sRate):
+    def _bin_integer(self, x, binparm, sRate, index=None):
+        """Bins a label vector: each window takes the first non-zero label
+        within it (zero if there is none). Windows are looked up in the
+        segment index of the labels rather than scanned."""
         x = np.asarray(x)
+        if index is None:
+            index = SegmentIndex(x)
 
         win_size = binparm.winsize*1e-3*sRate
         win_inc = binparm.wininc*1e-3*sRate
@@ -150,15 +333,9 @@ class DatasetBinned(Dataset):
         num_win = int(np.floor((num_sam-win_size)/win_inc))+1
         y = np.zeros((num_win,num_dim))
 
-        st = 0
-        en = win_size-1
-        for ii in range(num_win):
-            curwin = x[st:en,:]
-            num_non_zeros = np.count_nonzero(curwin)
-            if num_non_zeros == 0:
-                y[ii] = 0
-            else:
-                y[ii] = curwin[np.nonzero(curwin)[0][0]]
-            st += win_inc
-            en += win_inc
+        st = (np.arange(num_win)*win_inc).astype(int)
+        en = np.minimum((np.arange(num_win)*win_inc + win_size - 1).astype(int), num_sam)
+        first = index.first_nonzero(st)
+        found = first < en
+        y[found] = x[first[found]]
         return y
@@ -0,0 +1,162 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+
+class MajorityVote(object):
+    """Majority-vote smoothing of class decisions.
+
+    Class counts are kept over a ring of the last k decisions, together with
+    the number of classes having each count, so that every tick is updated
+    in constant time (the counts are only searched when the output changes).
+    The output changes to the most frequent class of the window when its
+    count exceeds that of the current output by more than hysteresis, and
+    the output has been held for at least min_dwell ticks.
+
+    Parameters
+    ----------
+
+    classes : array-like
+        Class labels.
+
+    k : integer
+        Number of decisions in the voting window.
+
+    min_dwell : integer, optional (default 1)
+        Minimum number of ticks an output is held.
+
+    hysteresis : integer, optional (default 0)
+        Margin (in votes) by which a class must outnumber the current output.
+
+    initial : optional
+        Output before the first change (default the first class, e.g. rest).
+
+    Attributes
+    ----------
+
+    counts_ : array, shape = (n_classes,)
+        Votes of each class in the window.
+
+    decision_ : label
+        Current output.
+    """
+
+    def __init__(self, classes, k, min_dwell=1, hysteresis=0, initial=None):
+        if not isinstance(k, int) or k < 1:
+            raise ValueError("k must be a positive integer.")
+        if min_dwell < 1:
+            raise ValueError("min_dwell must be at least 1.")
+        self.classes = np.asarray(classes)
+        self.k = k
+        self.min_dwell = min_dwell
+        self.hysteresis = hysteresis
+        self.initial = self.classes[0] if initial is None else initial
+        self._position = dict((c, i) for i, c in enumerate(self.classes.tolist()))
+        self.reset()
+
+    def reset(self):
+        n_classes = self.classes.size
+        self._ring = np.full(self.k, -1, dtype=int) # -1 marks empty slots
+        self._pos = 0
+        self.counts_ = np.zeros(n_classes, dtype=int)
+        # Number of classes with each count and the maximum count
+        self._freq = np.zeros(self.k + 1, dtype=int)
+        self._freq[0] = n_classes
+        self._max_count = 0
+        self._output = self._position[self._as_key(self.initial)]
+        self._held = self.min_dwell
+
+    @property
+    def decision_(self):
+        return self.classes[self._output]
+
+    def _as_key(self, label):
+        return label.item() if isinstance(label, np.generic) else label
+
+    def _add(self, c, delta):
+        count = self.counts_[c]
+        self._freq[count] -= 1
+        self._freq[count + delta] += 1
+        self.counts_[c] = count + delta
+        if count + delta > self._max_count:
+            self._max_count = count + delta
+        elif count == self._max_count and self._freq[count] == 0:
+            self._max_count = count - 1
+
+    def update(self, prediction):
+        """Adds a decision and returns the smoothed output."""
+        c = self._position[self._as_key(prediction)]
+        old = self._ring[self._pos]
+        if old >= 0:
+            self._add(old, -1)
+        self._ring[self._pos] = c
+        self._pos = (self._pos + 1) % self.k
+        self._add(c, 1)
+        self._held += 1
+        if self._held >= self.min_dwell and \
+                self._max_count > self.counts_[self._output] + self.hysteresis:
+            self._output = int(np.argmax(self.counts_))
+            self._held = 0
+        return self.classes[self._output]
+
+    def smooth(self, predictions):
+        """Replays a sequence of decisions offline, as reset() followed by
+        update() for each decision (the state of the smoother is not
+        modified).
+
+        Window counts are computed for all ticks at once from cumulative sums;
+        the output is then advanced from one change to the next with chunked
+        searches rather than tick by tick.
+
+        Parameters
+        ----------
+
+        predictions : array, shape = (n_samples,)
+            Class decisions.
+
+        Returns
+        -------
+
+        smoothed : array, shape = (n_samples,)
+            Smoothed outputs.
+        """
+        predictions = np.asarray(predictions).reshape(-1)
+        n = predictions.size
+        order = np.argsort(self.classes, kind='mergesort')
+        positions = order[np.searchsorted(self.classes, predictions, sorter=order)]
+        if not np.array_equal(self.classes[positions], predictions):
+            raise ValueError('Unknown class in predictions.')
+        cumulative = np.zeros((n + 1, self.classes.size), dtype=int)
+        np.cumsum(positions[:, np.newaxis] == np.arange(self.classes.size), axis=0, out=cumulative[1:])
+        counts = cumulative[1:] - cumulative[np.maximum(np.arange(1, n + 1) - self.k, 0)]
+        max_count = np.max(counts, axis=1) if n > 0 else np.zeros(0, dtype=int)
+
+        output = np.empty(n, dtype=int)
+        current = self._position[self._as_key(self.initial)]
+        t = 0 # First tick at which the output may change
+        last = 0 # Tick of the last change
+        while t < n:
+            change = self._next_change(counts, max_count, current, t)
+            output[last:change] = current
+            if change == n:
+                break
+            current = int(np.argmax(counts[change]))
+            last = change
+            t = change + self.min_dwell
+        else:
+            output[last:] = current
+        return self.classes[output]
+
+    def _next_change(self, counts, max_count, current, start):
+        """First tick from start at which the output changes (n if none),
+        searched in blocks of increasing size."""
+        n = max_count.size
+        block = 64
+        while start < n:
+            stop = min(n, start + block)
+            hits = np.nonzero(max_count[start:stop] > counts[start:stop, current] + self.hysteresis)[0]
+            if hits.size > 0:
+                return start + hits[0]
+            start = stop
+            block *= 2
+        return n
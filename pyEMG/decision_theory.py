@@ -6,7 +6,8 @@ Created on Wed Jun 29 17:22:43 2016
 """
 
 import numpy as np
-from sklearn.metrics import roc_curve, auc
+from sklearn.metrics import auc
+from pyEMG.segments import SegmentIndex
 
 class RocThreshold(object):
     """TODO: docstring"""
@@ -39,52 +40,204 @@ class RocThreshold(object):
         
         """
         
+        y_true = np.asarray(y_true).reshape(-1)
+        y_pred = np.asarray(y_pred)
         self.classes_ = np.unique(y_true)
         if self.n_classes_ == None:
             self.n_classes_ = self.classes_.size
         else:
             if self.classes_.size != self.n_classes_:
                 raise ValueError('Number of defined classes not compatible with classes in target vector.')
-        
+
+        keep, fpr, tpr, thresholds = self._roc_curves(y_true, y_pred)
         for i, class_ in enumerate(self.classes_):
-            idx = np.where(y_true == class_) # Find the instances belonging to the class
-            y_onevsall = np.zeros_like(y_true) # Convert to one-vs-all classifier
-            y_onevsall[idx] = 1 # Binary vector for each class
-            y_pred_onevsall = y_pred[:,i] # Estimated probabilities for the instances belonging to the class
-            self.fpr_[i], self.tpr_[i], self.thresholds_[i] = roc_curve(y_onevsall, y_pred_onevsall, drop_intermediate=self.drop_intermediate)
-            self.roc_auc_[i] = auc(self.fpr_[i], self.tpr_[i])         
-        
+            self.fpr_[i] = fpr[i, keep[i]]
+            self.tpr_[i] = tpr[i, keep[i]]
+            self.thresholds_[i] = thresholds[i, keep[i]]
+            self.roc_auc_[i] = auc(self.fpr_[i], self.tpr_[i])
+        self._set_optimal_thresholds(keep, fpr, tpr, thresholds)
+
+    def _roc_curves(self, y_true, y_pred):
+        """One-vs-all ROC curves of all classes, computed with one sort of
+        each probability column and cumulative sums (as roc_curve).
+
+        Returns boolean array keep and arrays fpr, tpr and thresholds, all of
+        shape = (n_classes, n_samples+1). The ROC points of class i are the
+        columns of row i where keep is True."""
+        n_samples, n_classes = y_pred.shape
+        scores = -np.ascontiguousarray(y_pred.T, dtype=float)
+        order = np.argsort(scores, axis=1) # Decreasing probabilities
+        scores = -np.take_along_axis(scores, order, axis=1)
+        positive = np.take_along_axis(self.classes_[:, np.newaxis] == y_true, order, axis=1)
+
+        # Extra threshold position (column 0) so that curves start at (0, 0)
+        tps = np.zeros((n_classes, n_samples + 1))
+        np.cumsum(positive, axis=1, out=tps[:, 1:])
+        fps = np.arange(n_samples + 1) - tps
+        thresholds = np.empty((n_classes, n_samples + 1))
+        thresholds[:, 0] = np.inf
+        thresholds[:, 1:] = scores
+
+        # One point per distinct probability value (the last of ties)
+        keep = np.ones((n_classes, n_samples + 1), dtype=bool)
+        np.not_equal(scores[:, 1:], scores[:, :-1], out=keep[:, 1:-1])
+        if self.drop_intermediate:
+            keep[:, 1:] &= _corners(keep[:, 1:], fps[:, 1:], tps[:, 1:])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fpr = fps / fps[:, -1:]
+            tpr = tps / tps[:, -1:]
+        return keep, fpr, tpr, thresholds
+
+    def _set_optimal_thresholds(self, keep, fpr, tpr, thresholds):
         if self.method == 'max_random':
-            self._compute_threshold_max_random()
+            optimal = self._compute_threshold_max_random(keep, fpr, tpr, thresholds)
         elif self.method == 'min_perfect':
-            self._compute_threshold_min_perfect()
+            optimal = self._compute_threshold_min_perfect(keep, fpr, tpr, thresholds)
         elif self.method == 'custom':
-            self._compute_threshold_custom()
+            optimal = self._compute_threshold_custom(keep, fpr, tpr, thresholds)
         else:
             raise ValueError('Unrecognized method.')
-        
-    def _compute_threshold_max_random(self):
-        for i, class_ in enumerate(self.classes_):
-            rnd_clf_tpr = np.linspace(0,1,self.thresholds_[i].size)
-            self.optimal_threshold_[i] = self.thresholds_[i][np.argmax(self.tpr_[i]-rnd_clf_tpr)]
+        self.optimal_threshold_ = dict(enumerate(optimal))
 
-    def _compute_threshold_min_perfect(self):
-        for i, class_ in enumerate(self.classes_):
-            self.optimal_threshold_[i] = self.thresholds_[i][np.argmin(np.sqrt((self.tpr_[i]-1)**2 + (self.fpr_[i]-0)**2))]
-    
-    def _compute_threshold_custom(self):
+    def _compute_threshold_max_random(self, keep, fpr, tpr, thresholds):
+        """Threshold of the ROC point furthest above the random classifier
+        (a straight line over the points of each curve)."""
+        n_points = np.sum(keep, axis=1)[:, np.newaxis]
+        rank = np.cumsum(keep, axis=1) - 1
+        rnd_clf_tpr = rank * (1. / (n_points - 1)) # As np.linspace(0, 1, n_points)
+        rnd_clf_tpr[rank == n_points - 1] = 1.
+        optimal = np.argmax(np.where(keep, tpr - rnd_clf_tpr, -np.inf), axis=1)
+        return thresholds[np.arange(keep.shape[0]), optimal]
+
+    def _compute_threshold_min_perfect(self, keep, fpr, tpr, thresholds):
+        """Threshold of the ROC point closest to the perfect classifier."""
+        distance = np.sqrt((tpr-1)**2 + (fpr-0)**2)
+        optimal = np.argmin(np.where(keep, distance, np.inf), axis=1)
+        return thresholds[np.arange(keep.shape[0]), optimal]
+
+    def _compute_threshold_custom(self, keep, fpr, tpr, thresholds):
         """Select the lowest threshold for which false positive rate is larger than a threshold.
-        For the rest class, set the threshold to 0. Maximum allowed threshold value is 0.999. """
-        for i, class_ in enumerate(self.classes_):
-            turning_point = np.where(self.fpr_[i]>self.fpr_threshold)[0][0]
-            class_threshold = self.thresholds_[i][turning_point]
-            if class_threshold < 0.995:
-                self.optimal_threshold_[i] = class_threshold
-            else:
-                self.optimal_threshold_[i] = 0.995
-            
-        
-                
+        Maximum allowed threshold value is 0.995. """
+        above = keep & (fpr > self.fpr_threshold)
+        if not np.all(np.any(above, axis=1)):
+            raise ValueError('False positive rate does not exceed fpr_threshold.')
+        turning_point = np.argmax(above, axis=1)
+        return np.minimum(thresholds[np.arange(keep.shape[0]), turning_point], 0.995)
+
+
+class IncrementalRocThreshold(RocThreshold):
+    """ROC thresholds recalibrated from streaming predictions.
+
+    Probabilities are accumulated in fixed histograms of n_bins bins per
+    class, for positive (one-vs-all) and negative instances, so memory does
+    not depend on the amount of data seen. ROC curves have one point per
+    bin (thresholds are the lower bin edges) and thresholds are updated in
+    O(n_classes*n_bins) after every batch. The min_perfect and custom rules
+    are those of RocThreshold. The max_random rule of RocThreshold measures
+    the distance from a line through the ROC points in rank order, which
+    depends on the number of points (one per non-empty bin here); it is
+    replaced by the distance from the diagonal, tpr - fpr, hence it may
+    select a different threshold than RocThreshold on the same data.
+
+    Parameters
+    ----------
+
+    classes : array-like
+        Sorted class labels; columns of probabilities follow this order.
+    n_bins : int
+        Number of probability bins in [0, 1].
+    forgetting_factor : float
+        Weight of past samples is multiplied by forgetting_factor for every
+        new sample (1. for no forgetting).
+
+    See RocThreshold for the other parameters.
+    """
+
+    def __init__(self, classes, method=None, drop_intermediate=None, fpr_threshold=None,
+                 n_bins=1000, forgetting_factor=1.):
+        classes = np.asarray(classes)
+        super(IncrementalRocThreshold, self).__init__(classes.size, method, drop_intermediate, fpr_threshold)
+        if not 0. < forgetting_factor <= 1.:
+            raise ValueError('forgetting_factor must be in (0, 1].')
+        self.classes_ = classes
+        self.n_bins = n_bins
+        self.forgetting_factor = forgetting_factor
+        self.reset()
+
+    def reset(self):
+        self.positive_hist_ = np.zeros((self.n_classes_, self.n_bins))
+        self.negative_hist_ = np.zeros((self.n_classes_, self.n_bins))
+
+    def partial_fit(self, y_true, y_pred):
+        """Adds a batch of labels and predicted probabilities, shape =
+        (n_samples, n_classes), and updates the optimal thresholds."""
+        y_true = np.asarray(y_true).reshape(-1)
+        y_pred = np.asarray(y_pred)
+        n_classes, n_bins = self.n_classes_, self.n_bins
+        if self.forgetting_factor < 1.:
+            decay = self.forgetting_factor ** y_true.size
+            self.positive_hist_ *= decay
+            self.negative_hist_ *= decay
+        bins = np.clip((y_pred * n_bins).astype(int), 0, n_bins - 1) + np.arange(n_classes) * n_bins
+        positive = y_true[:, np.newaxis] == self.classes_
+        self.positive_hist_ += np.bincount(bins[positive], minlength=n_classes*n_bins).reshape((n_classes, n_bins))
+        self.negative_hist_ += np.bincount(bins[~positive], minlength=n_classes*n_bins).reshape((n_classes, n_bins))
+
+        keep, fpr, tpr, thresholds = self._roc_curves()
+        for i in range(n_classes):
+            self.fpr_[i] = fpr[i, keep[i]]
+            self.tpr_[i] = tpr[i, keep[i]]
+            self.thresholds_[i] = thresholds[i, keep[i]]
+            self.roc_auc_[i] = auc(self.fpr_[i], self.tpr_[i])
+        self._set_optimal_thresholds(keep, fpr, tpr, thresholds)
+        return self
+
+    def _roc_curves(self):
+        """ROC curves of the histograms, in the layout of
+        RocThreshold._roc_curves (bins in decreasing order)."""
+        n_classes, n_bins = self.n_classes_, self.n_bins
+        tps = np.zeros((n_classes, n_bins + 1))
+        fps = np.zeros((n_classes, n_bins + 1))
+        np.cumsum(self.positive_hist_[:, ::-1], axis=1, out=tps[:, 1:])
+        np.cumsum(self.negative_hist_[:, ::-1], axis=1, out=fps[:, 1:])
+        thresholds = np.empty((n_classes, n_bins + 1))
+        thresholds[:, 0] = np.inf
+        thresholds[:, 1:] = np.arange(n_bins - 1, -1, -1) / float(n_bins)
+
+        # Empty bins do not add points
+        keep = np.ones((n_classes, n_bins + 1), dtype=bool)
+        keep[:, 1:] = (self.positive_hist_ + self.negative_hist_)[:, ::-1] > 0
+        if self.drop_intermediate:
+            keep[:, 1:] &= _corners(keep[:, 1:], fps[:, 1:], tps[:, 1:])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fpr = fps / fps[:, -1:]
+            tpr = tps / tps[:, -1:]
+        return keep, fpr, tpr, thresholds
+
+    def _compute_threshold_max_random(self, keep, fpr, tpr, thresholds):
+        """Threshold of the ROC point furthest above the diagonal (Youden's
+        index), which does not depend on the number of points."""
+        optimal = np.argmax(np.where(keep, tpr - fpr, -np.inf), axis=1)
+        return thresholds[np.arange(keep.shape[0]), optimal]
+
+
+def _corners(keep, fps, tps):
+    """Marks the points of each curve (columns of each row where keep is
+    True) that are not collinear with their neighbouring points, as
+    roc_curve with drop_intermediate=True."""
+    rows, cols = np.nonzero(keep) # Points of all curves, one after the other
+    fps = fps[rows, cols]
+    tps = tps[rows, cols]
+    corner = np.ones(rows.size, dtype=bool)
+    # Points with both neighbours on the same curve
+    inner = rows[:-2] == rows[2:]
+    corner[1:-1] = ~inner | (np.diff(fps, 2) != 0) | (np.diff(tps, 2) != 0)
+    out = np.zeros(keep.shape, dtype=bool)
+    out[rows, cols] = corner
+    return out
+
 def control_action(state_old, prediction, prediction_proba, threshold):
     """Decide whether to move to a new state or stick with the old one."""
     if (state_old != prediction) and (prediction_proba > threshold):
@@ -96,4 +249,83 @@ def control_action(state_old, prediction, prediction_proba, threshold):
 
         
         
-        
\ No newline at end of file
+        
+
+def replay_control(predictions, prediction_proba, thresholds, initial_state=0, classes=None):
+    """Replays control_action over a sequence of predictions.
+
+    The state moves to the predicted class whenever its probability exceeds
+    the class threshold, hence the state sequence is the last accepted
+    prediction carried forward, which is computed without a loop over
+    samples.
+
+    Parameters
+    ----------
+
+    predictions : array, shape = (n_samples,)
+        Predicted classes.
+    prediction_proba : array, shape = (n_samples,) or (n_samples, n_classes)
+        Probability of each prediction, or probabilities of all classes.
+    thresholds : float, array-like or dict
+        Threshold, common or for each class (e.g. optimal_threshold_ of
+        RocThreshold).
+    initial_state : int
+        State before the first sample.
+    classes : array-like, optional
+        Sorted class labels, giving the positions of classes in
+        prediction_proba and thresholds. By default, predictions are taken
+        as these positions.
+
+    Returns
+    -------
+
+    states : array, shape = (n_samples,)
+        State after each sample.
+    """
+    predictions = np.asarray(predictions).reshape(-1)
+    prediction_proba = np.asarray(prediction_proba)
+    position = predictions if classes is None else np.searchsorted(np.asarray(classes), predictions)
+    if prediction_proba.ndim == 2:
+        prediction_proba = prediction_proba[np.arange(predictions.size), position]
+    if isinstance(thresholds, dict):
+        thresholds = np.asarray([thresholds[i] for i in range(len(thresholds))])
+    thresholds = np.asarray(thresholds, dtype=float)
+    if thresholds.ndim > 0:
+        thresholds = thresholds[position]
+
+    accepted = prediction_proba > thresholds
+    # Index of the last accepted prediction at each sample (-1 if none)
+    last = np.maximum.accumulate(np.where(accepted, np.arange(predictions.size), -1))
+    states = np.where(last >= 0, predictions[np.maximum(last, 0)], initial_state)
+    return states.astype(np.result_type(predictions, np.asarray(initial_state)))
+
+def state_change_latency(states, y_true):
+    """Latency of the state following each change of the true class.
+
+    Parameters
+    ----------
+
+    states : array, shape = (n_samples,)
+        Controller states, e.g. returned by replay_control.
+    y_true : array, shape = (n_samples,)
+        True classes.
+
+    Returns
+    -------
+
+    latencies : array, shape = (n_changes,)
+        Number of samples from each change of y_true until the state first
+        equals the new class, NaN if it does not do so before the next
+        change. Summary statistics can be computed with np.nanmean,
+        np.nanmedian and np.isnan.
+    """
+    states = np.asarray(states).reshape(-1)
+    index = SegmentIndex(y_true)
+    n_samples = states.size
+    match = states == np.repeat(index.label, index.lengths)
+    # First matching sample at or after each sample
+    following = np.minimum.accumulate(np.where(match, np.arange(n_samples), n_samples)[::-1])[::-1]
+    start, stop = index.start[1:], index.stop[1:]
+    latencies = (following[start] - start).astype(float)
+    latencies[following[start] >= stop] = np.nan
+    return latencies
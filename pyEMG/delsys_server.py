@@ -41,6 +41,13 @@ class DelsysStation(object):
     samplesPerPacket : int
         number of samples in each packet received from the Trigno base
 
+    emg_filter : object, optional
+        online filter (e.g. pyEMG.filters_online.ButterworthFilter) applied
+        to each EMG packet before it is buffered
+
+    imu_filter : object, optional
+        online filter applied to each IMU packet before it is buffered
+
     Attributes
     ----------
 
@@ -51,7 +58,8 @@ class DelsysStation(object):
         list of timestamps (1st: EMG, 2nd: IMU)
     '''
     def __init__(self, buffered=True, host_ip = '127.0.0.1', bufsize = 1.,
-                 samplesPerPacket = 1, imu_type=None):
+                 samplesPerPacket = 1, imu_type=None, emg_filter=None,
+                 imu_filter=None):
 
         self.host = host_ip
         self.dataPort = 50043
@@ -64,6 +72,7 @@ class DelsysStation(object):
         self.buffered = buffered
         self.bufsize = bufsize
         self.samplesPerPacket = samplesPerPacket
+        self.filters = [emg_filter, imu_filter]
         self.imuType = 'raw' if imu_type is None else imu_type
         self.__numSensors = 16
         self.__emgRate = 2000
@@ -103,6 +112,9 @@ class DelsysStation(object):
         '''
 
         self.flush() # Reset buffer
+        for filt in self.filters: # Filters start afresh on a new connection
+            if filt is not None:
+                filt.reset()
         print("connect to " + str(self.host))
         self.sdk = socket.create_connection((self.host, self.sdkPort))
         self.imu = socket.create_connection((self.host, self.imuPort))
@@ -150,6 +162,8 @@ class DelsysStation(object):
             data = np.asarray(unpack('<'+'f'*(int(recSize/self.__bytesPerSample)), data))
             data = data.reshape((shp))
             data = np.delete(data, dummy_cols, axis=1)
+            if self.filters[buf_index] is not None:
+                data = self.filters[buf_index].filter(data, out=data)
             timestamp = np.asarray([timeit.default_timer()])
 
             if self.buffered:
@@ -6,24 +6,27 @@ Created on Sat Mar 19 15:02:44 2016
 """
 import numpy as np
 from scipy.signal import butter, filtfilt
+from pyEMG.filters_utils import comb_coefficients, comb_filtfilt, filter_channels
 
-def emg_filter_bandpass(x, order = 4, sRate = 2000., lowcut = 10., highcut = 500.):
-    """ Forward-backward band-pass filtering (IIR butterworth filter) """
+def emg_filter_bandpass(x, order = 4, sRate = 2000., lowcut = 10., highcut = 500., n_jobs = 1):
+    """ Forward-backward band-pass filtering (IIR butterworth filter).
+        Channels are filtered in n_jobs threads (all CPUs if None). """
     nyq = 0.5 * sRate
     low = lowcut/nyq
     high = highcut/nyq
     b, a = butter(order, [low, high], btype = 'band')
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd', 
-                    padlen = np.minimum(3*np.maximum(len(a),len(b)), x.shape[0]-1))
-    
-def emg_filter_comb(x):
-    """ Comb filtering at 50 Hz, for 2KHz sampling frequency. 
-        Coefficients are computed with MATLAB."""
-    b = np.zeros(41)
-    a = np.zeros(41)
-    b[0] = 0.941160767899653
-    b[-1] = -0.941160767899653
-    a[0] = 1.
-    a[-1] = -0.882321535799305
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
-                    padlen = np.minimum(3*np.maximum(len(a),len(b)), x.shape[0]-1))
\ No newline at end of file
+    padlen = np.minimum(3*np.maximum(len(a),len(b)), x.shape[0]-1)
+    def _filter(x, out):
+        out[...] = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
+                            padlen = padlen)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
+
+def emg_filter_comb(x, sRate = 2000., mains = 50., bandwidth = None, n_jobs = 1):
+    """ Forward-backward comb filtering at the mains frequency (50 Hz by
+        default). The default bandwidth is that of the coefficients
+        originally computed with MATLAB for 2KHz sampling frequency.
+        Channels are filtered in n_jobs threads (all CPUs if None). """
+    delay, gain, pole = comb_coefficients(sRate, mains, bandwidth)
+    def _filter(x, out):
+        out[...] = comb_filtfilt(x, delay, gain, pole)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
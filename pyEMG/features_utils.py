@@ -2,6 +2,7 @@
 
 """
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from scipy import fftpack
 from scipy.signal import signaltools
 
@@ -185,6 +186,86 @@ def autocorr(x, **kwargs):
     return autocov(x, **kwargs)
 
 
+def lagged_crosscov(x, y=None, num_lags=1, normalize=True):
+    """Returns the lagged cross-products between all pairs of channels of two
+    multichannel signals.
+
+    This is a real-FFT successor of crosscov for many channels and few lags.
+    The signals are split into short blocks, the cross-spectra of all channel
+    pairs are accumulated over blocks with one batched matrix product and a
+    single inverse FFT is performed at the end. The cost is therefore roughly
+    independent of num_lags.
+
+    Parameters
+    ----------
+
+    x : ndarray, shape = (n_samples, n_x)
+    y : ndarray, shape = (n_samples, n_y), optional
+       Defaults to x.
+    num_lags : int
+       Number of (non-negative) lags.
+    normalize : {True/False}
+       whether to divide by the number of samples
+
+    Returns
+    -------
+
+    cxy : ndarray, shape = (num_lags, n_x, n_y)
+       The lagged cross-products
+
+    Notes
+    -----
+
+    .. math::
+
+    C_{xy}[k, a, b]=\sum_{n} X_a[n]Y_b[n+k]
+
+    where Y is zero beyond its last sample. Signals are not debiased.
+    """
+    x = np.ascontiguousarray(x, dtype=float)
+    y = x if y is None else np.ascontiguousarray(y, dtype=float)
+    if x.shape[0] != y.shape[0]:
+        raise ValueError('lagged_crosscov() only works on same-length sequences')
+    n = x.shape[0]
+    nfft = max(64, 2 ** int(np.ceil(np.log2(4 * num_lags))))
+    block = nfft - num_lags + 1
+    S = np.zeros((nfft // 2 + 1, x.shape[1], y.shape[1]), dtype=complex)
+
+    # Blocks whose lagged segment of y lies within the signal are views
+    n_inner = max(0, (n - num_lags + 1) // block)
+    batch = max(1, 2 ** 22 // (nfft * max(x.shape[1], y.shape[1])))
+    for start in range(0, n_inner, batch):
+        stop = min(start + batch, n_inner)
+        xb = x[start*block:stop*block].reshape((stop - start, block, x.shape[1]))
+        yb = as_strided(y[start*block:], shape=(stop - start, block + num_lags - 1, y.shape[1]),
+                        strides=(block * y.strides[0],) + y.strides)
+        _accumulate_cross_spectra(S, xb, yb, nfft)
+
+    # Remaining samples are zero-padded
+    n_outer = int(np.ceil((n - n_inner * block) / float(block)))
+    if n_outer > 0:
+        xt = np.zeros((n_outer * block, x.shape[1]))
+        yt = np.zeros((n_outer * block + num_lags - 1, y.shape[1]))
+        xt[:n - n_inner * block] = x[n_inner * block:]
+        yt[:n - n_inner * block] = y[n_inner * block:]
+        xb = xt.reshape((n_outer, block, x.shape[1]))
+        yb = as_strided(yt, shape=(n_outer, block + num_lags - 1, y.shape[1]),
+                        strides=(block * yt.strides[0],) + yt.strides)
+        _accumulate_cross_spectra(S, xb, yb, nfft)
+
+    cxy = np.fft.irfft(S, n=nfft, axis=0)[:num_lags]
+    if normalize:
+        cxy /= n
+    return cxy
+
+
+def _accumulate_cross_spectra(S, xb, yb, nfft):
+    """Adds the cross-spectra of blocks xb and yb (along axis 1) to S."""
+    XB = np.fft.rfft(xb, n=nfft, axis=1).transpose((1, 2, 0)).conj()
+    YB = np.fft.rfft(yb, n=nfft, axis=1).transpose((1, 0, 2))
+    S += np.matmul(XB, YB)
+
+
 def fftconvolve(in1, in2, mode="full", axis=None):
     """ Convolve two N-dimensional arrays using FFT. See convolve.
 
@@ -0,0 +1,122 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+from pyEMG.filters_utils import (butter_sos, comb_coefficients, comb_filter,
+                                 comb_filter_zi, odd_ext)
+
+class FilterBank(object):
+    """Cascade of IIR filters applied with a single forward-backward pass.
+
+    The Butterworth stages are fused into one chain of second-order sections
+    and comb stages are applied through their sparse representation, so that
+    the signal is traversed once forwards and once backwards regardless of
+    the number of stages. Filter designs are cached (see
+    filters_utils.butter_sos).
+
+    Parameters
+    ----------
+
+    sRate : float
+        Sampling frequency (Hz).
+
+    dtype : numpy dtype, optional (default float64)
+        Data type of the filtered signal. With float32 the filtered output
+        requires half the memory.
+
+    Attributes
+    ----------
+
+    sos_ : array, shape = (n_sections, 6)
+        Second-order sections of the Butterworth stages.
+
+    combs_ : list of tuples
+        (delay, gain, pole) coefficients of the comb stages.
+
+    Examples
+    --------
+
+    >>> bank = FilterBank(sRate=2000.).add_butter(4, 10., 500.).add_comb()
+    >>> emg = bank.filter(emg, out=emg)
+
+    """
+
+    def __init__(self, sRate, dtype=np.float64):
+        self.sRate = sRate
+        self.dtype = np.dtype(dtype)
+        self.sos_ = np.zeros((0, 6))
+        self.combs_ = []
+
+    def add_butter(self, order=4, lowcut=None, highcut=None):
+        """Appends a Butterworth stage (band-pass if both cut-off frequencies
+        are given, high-pass if only lowcut and low-pass if only highcut)."""
+        sos = butter_sos(order, self.sRate, lowcut=lowcut, highcut=highcut)
+        self.sos_ = np.vstack((self.sos_, sos))
+        return self
+
+    def add_comb(self, mains=50., bandwidth=None):
+        """Appends a comb stage at the mains frequency. See
+        filters_utils.comb_coefficients."""
+        self.combs_.append(comb_coefficients(self.sRate, mains, bandwidth))
+        return self
+
+    def filter(self, x, out=None):
+        """Forward-backward (zero-phase) filtering along the first axis.
+
+        Channels are filtered one at a time, hence apart from the output only
+        a single-channel working copy is allocated.
+
+        Parameters
+        ----------
+
+        x : array, shape = (n_samples,) or (n_samples, n_channels)
+            Signal to be filtered.
+
+        out : array, optional
+            Array of the same shape as x, and of type dtype, where the output
+            is written. It may be x itself for in-place filtering.
+
+        Returns
+        -------
+
+        y : array
+            Filtered signal (out, if provided).
+
+        """
+        if self.sos_.shape[0] == 0 and len(self.combs_) == 0:
+            raise ValueError('Filter bank has no stages.')
+        x = np.asarray(x)
+        if out is None:
+            out = np.empty(x.shape, dtype=self.dtype)
+        elif out.shape != x.shape or out.dtype != self.dtype:
+            raise ValueError('Output array must have the shape of x and type {}.'.format(self.dtype))
+        padlen = np.minimum(self._default_padlen(), x.shape[0]-1)
+        x2d = x.reshape((x.shape[0], -1))
+        out2d = out.reshape((out.shape[0], -1))
+        sos = self.sos_.astype(self.dtype)
+        zi = sosfilt_zi(self.sos_).astype(self.dtype)
+        for ch in range(x2d.shape[1]):
+            ext = odd_ext(x2d[:, ch].astype(self.dtype), padlen)
+            y = self._forward(ext, sos, zi)
+            y = self._forward(y[::-1], sos, zi)
+            out2d[:, ch] = y[::-1][padlen:ext.shape[0]-padlen]
+        return out
+
+    def _forward(self, x, sos, zi):
+        """Causal pass of a single channel through all stages, starting from
+        the steady state for the first sample."""
+        if sos.shape[0] > 0:
+            x, __ = sosfilt(sos, x, zi=zi * x[0])
+        for delay, gain, pole in self.combs_:
+            x, __ = comb_filter(x, delay, gain, pole, zi=comb_filter_zi(x[0], gain, delay))
+        return x
+
+    def _default_padlen(self):
+        """Edge padding length, the longest of scipy.signal.sosfiltfilt for
+        the Butterworth stages and scipy.signal.filtfilt for the comb stages."""
+        n_zeros = min((self.sos_[:, 2] == 0).sum(), (self.sos_[:, 5] == 0).sum())
+        padlen = 3 * (2 * self.sos_.shape[0] + 1 - n_zeros) if self.sos_.shape[0] > 0 else 0
+        for delay, __, __ in self.combs_:
+            padlen = max(padlen, 3 * (delay + 1))
+        return padlen
@@ -0,0 +1,181 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+from pyEMG.filters_utils import (butter_sos, comb_coefficients, comb_filter,
+                                 comb_filter_zi)
+
+class OnlineFilter(object):
+    """Causal IIR filter for streamed data.
+
+    The filter state is kept across calls, hence each new chunk of data is
+    filtered in O(chunk) time and without edge artifacts.
+
+    Parameters
+    ----------
+
+    sos : array, shape = (n_sections, 6)
+        Filter coefficients in second-order sections.
+
+    n_channels : int
+        Number of channels (columns) of the filtered signal.
+
+    steady_state : boolean, optional (default True)
+        If True, the filter state is initialised to the steady-state response
+        to the first sample received, otherwise to zeros.
+
+    Attributes
+    ----------
+
+    zi_ : array, shape = (n_sections, 2, n_channels)
+        Filter state. None until the first chunk is filtered.
+
+    """
+
+    def __init__(self, sos, n_channels, steady_state=True):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=float))
+        self.n_channels = n_channels
+        self.steady_state = steady_state
+        self.zi_ = None
+
+    def reset(self):
+        """Resets the filter state."""
+        self.zi_ = None
+
+    def filter(self, x, out=None):
+        """Filters a new chunk of data.
+
+        Parameters
+        ----------
+
+        x : array, shape = (n_samples, n_channels) or (n_channels,)
+            Most recent samples. A 1D array is treated as a single sample.
+
+        out : array, optional
+            Array of the same shape as x where the output is written. It may
+            be x itself.
+
+        Returns
+        -------
+
+        y : array
+            Filtered chunk (out, if provided).
+
+        """
+        x = np.asarray(x)
+        y = x[np.newaxis, :] if x.ndim == 1 else x
+        if y.shape[1] != self.n_channels:
+            raise ValueError("Data must have {} channels.".format(self.n_channels))
+        if self.zi_ is None:
+            if self.steady_state:
+                self.zi_ = sosfilt_zi(self.sos)[:, :, np.newaxis] * y[0]
+            else:
+                self.zi_ = np.zeros((self.sos.shape[0], 2, self.n_channels))
+        y, self.zi_ = sosfilt(self.sos, y, axis=0, zi=self.zi_)
+        y = y.reshape(x.shape)
+        if out is None:
+            return y
+        out[...] = y
+        return out
+
+class ButterworthFilter(OnlineFilter):
+    """Causal Butterworth filter for streamed data.
+
+    Band-pass if both lowcut and highcut are given, high-pass if only lowcut
+    is given and low-pass if only highcut is given. See OnlineFilter.
+
+    Parameters
+    ----------
+
+    n_channels : int
+        Number of channels (columns) of the filtered signal.
+
+    order : int, optional (default 4)
+        Filter order.
+
+    sRate : float, optional (default 2000.)
+        Sampling frequency (Hz).
+
+    lowcut : float, optional
+        Lower cut-off frequency (Hz).
+
+    highcut : float, optional
+        Upper cut-off frequency (Hz).
+
+    """
+
+    def __init__(self, n_channels, order=4, sRate=2000., lowcut=None,
+                 highcut=None, steady_state=True):
+        sos = butter_sos(order, sRate, lowcut=lowcut, highcut=highcut)
+        super(ButterworthFilter, self).__init__(sos, n_channels, steady_state)
+        self.order = order
+        self.sRate = sRate
+        self.lowcut = lowcut
+        self.highcut = highcut
+
+class CombFilter(object):
+    """Causal comb filter for streamed data, removing mains interference.
+
+    The sparse structure of the comb filter is exploited, i.e. only two taps
+    per sample are computed (see filters_utils.comb_filter). The filter
+    state is kept across calls.
+
+    Parameters
+    ----------
+
+    n_channels : int
+        Number of channels (columns) of the filtered signal.
+
+    sRate : float, optional (default 2000.)
+        Sampling frequency (Hz).
+
+    mains : float, optional (default 50.)
+        Mains frequency (Hz).
+
+    bandwidth : float, optional
+        -3 dB bandwidth of the notches (Hz). See filters_utils.comb_coefficients.
+
+    steady_state : boolean, optional (default True)
+        If True, the filter state is initialised to the steady-state response
+        to the first sample received, otherwise to zeros.
+
+    Attributes
+    ----------
+
+    zi_ : array, shape = (delay, n_channels)
+        Filter state. None until the first chunk is filtered.
+
+    """
+
+    def __init__(self, n_channels, sRate=2000., mains=50., bandwidth=None,
+                 steady_state=True):
+        self.n_channels = n_channels
+        self.sRate = sRate
+        self.mains = mains
+        self.bandwidth = bandwidth
+        self.steady_state = steady_state
+        self.delay, self.gain, self.pole = comb_coefficients(sRate, mains, bandwidth)
+        self.zi_ = None
+
+    def reset(self):
+        """Resets the filter state."""
+        self.zi_ = None
+
+    def filter(self, x, out=None):
+        """Filters a new chunk of data. See OnlineFilter.filter."""
+        x = np.asarray(x)
+        y = x[np.newaxis, :] if x.ndim == 1 else x
+        if y.shape[1] != self.n_channels:
+            raise ValueError("Data must have {} channels.".format(self.n_channels))
+        if self.zi_ is None:
+            if self.steady_state:
+                self.zi_ = comb_filter_zi(y[0], self.gain, self.delay)
+            else:
+                self.zi_ = np.zeros((self.delay, self.n_channels))
+        y, self.zi_ = comb_filter(y, self.delay, self.gain, self.pole, zi=self.zi_)
+        y = y.reshape(x.shape)
+        if out is None:
+            return y
+        out[...] = y
+        return out
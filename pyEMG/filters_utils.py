@@ -0,0 +1,356 @@
+"""Filter design utilities shared by the offline and online filters.
+
+"""
+import warnings
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy.signal import butter, lfilter, sosfilt, sosfilt_zi
+
+# Feed-forward gain of the 50 Hz comb filter originally designed in MATLAB
+_MATLAB_COMB_GAIN = 0.941160767899653
+# Blocks of delay samples solved per matrix product in comb_filter
+_COMB_BLOCKS = 32
+
+# Filter designs, keyed by (type, order, sampling rate, cut-off frequencies)
+_DESIGNS = dict()
+
+def butter_sos(order, sRate, lowcut=None, highcut=None):
+    """Butterworth filter design in second-order sections.
+
+    The filter type depends on the cut-off frequencies provided: band-pass if
+    both are given, high-pass if only lowcut is given and low-pass if only
+    highcut is given.
+
+    Parameters
+    ----------
+
+    order : int
+        Filter order.
+    sRate : float
+        Sampling frequency (Hz).
+    lowcut : float, optional
+        Lower cut-off frequency (Hz).
+    highcut : float, optional
+        Upper cut-off frequency (Hz).
+
+    Returns
+    -------
+
+    sos : array, shape = (n_sections, 6)
+        Second-order sections. Designs are cached; a copy is returned.
+    """
+    key = ('butter', order, float(sRate), lowcut, highcut)
+    if key not in _DESIGNS:
+        _DESIGNS[key] = _butter_sos(order, sRate, lowcut, highcut)
+    return _DESIGNS[key].copy()
+
+def _butter_sos(order, sRate, lowcut, highcut):
+    nyq = 0.5 * sRate
+    if lowcut is not None and highcut is not None:
+        Wn, btype = [lowcut/nyq, highcut/nyq], 'band'
+    elif lowcut is not None:
+        Wn, btype = lowcut/nyq, 'high'
+    elif highcut is not None:
+        Wn, btype = highcut/nyq, 'low'
+    else:
+        raise ValueError('At least one of lowcut and highcut must be given.')
+    return butter(order, Wn, btype=btype, output='sos')
+
+def comb_coefficients(sRate=2000., mains=50., bandwidth=None):
+    """Comb filter design for the removal of mains interference.
+
+    The filter has transfer function
+    H(z) = gain * (1 - z^-delay) / (1 - pole * z^-delay), i.e. notches at
+    DC and every multiple of the mains frequency. Only three numbers are
+    needed to describe it.
+
+    Parameters
+    ----------
+
+    sRate : float, optional (default 2000.)
+        Sampling frequency (Hz). It should be a multiple of mains, otherwise
+        the delay is rounded to the nearest integer.
+    mains : float, optional (default 50.)
+        Mains frequency (Hz).
+    bandwidth : float, optional
+        -3 dB bandwidth of the notches (Hz). By default, the bandwidth of the
+        original coefficients computed with MATLAB (about 2 Hz) is used.
+
+    Returns
+    -------
+
+    delay : int
+        Comb delay (samples).
+    gain : float
+        Feed-forward gain.
+    pole : float
+        Feedback coefficient.
+    """
+    delay = int(round(sRate / mains))
+    if not np.isclose(delay, sRate / mains):
+        warnings.warn('Sampling rate is not a multiple of the mains frequency. '
+                      'Comb delay rounded to {} samples.'.format(delay))
+    if bandwidth is None:
+        gain = _MATLAB_COMB_GAIN
+    else:
+        # As in MATLAB iircomb, with 3 dB attenuation at the band edges
+        gain = 1. / (1. + np.tan(np.pi * bandwidth / (2. * mains)))
+    return delay, gain, 2. * gain - 1.
+
+def comb_filter_zi(x0, gain, delay):
+    """Comb filter state corresponding to the steady-state response to a
+    constant input x0 (as scipy.signal.lfilter_zi)."""
+    x0 = np.asarray(x0, dtype=float)
+    return np.ones((delay,) + x0.shape) * (-gain * x0)
+
+def comb_filter(x, delay, gain, pole, zi=None):
+    """Causal comb filtering along the first axis.
+
+    The sparse structure of the filter is exploited: the feedforward part
+    g*(x[n] - x[n-delay]) is computed at once, and the recursion
+    y[n] = v[n] + pole*y[n-delay] is run across blocks of delay samples.
+    Groups of _COMB_BLOCKS consecutive blocks are solved with one matrix
+    product each, and the groups are then linked by a recursion on their
+    last blocks.
+
+    Parameters
+    ----------
+
+    x : array, shape = (n_samples, ...)
+        Signal to be filtered.
+    delay, gain, pole : int, float, float
+        Filter coefficients (see comb_coefficients).
+    zi : array, shape = (delay, ...), optional
+        Initial filter state for the next delay samples. Zeros by default.
+
+    Returns
+    -------
+
+    y : array, shape = (n_samples, ...)
+        Filtered signal.
+    zf : array, shape = (delay, ...)
+        Final filter state.
+    """
+    x = np.asarray(x)
+    n = x.shape[0]
+    rest = x.shape[1:]
+    z = np.zeros((delay,) + rest) if zi is None else np.asarray(zi)
+    dtype = np.result_type(x.dtype, np.float32)
+    if n == 0:
+        return np.empty(x.shape, dtype=dtype), z
+    n_blocks = -(-n // delay)
+    group = min(_COMB_BLOCKS, n_blocks)
+    n_groups = -(-n_blocks // group)
+    # Feedforward part, zero-padded to a whole number of groups
+    v = np.zeros((n_groups * group * delay,) + rest, dtype=dtype)
+    head = min(delay, n)
+    v[:head] = x[:head]
+    if n > delay:
+        np.subtract(x[delay:], x[:n-delay], out=v[delay:n])
+    v[:n] *= gain
+    v[:head] += z[:head]
+    v = v.reshape((n_groups, group, -1))
+    # Recursion within groups: y = T v, with T[i, j] = pole**(i-j), i >= j
+    lags = np.arange(group)
+    T = np.tril(pole ** np.subtract.outer(lags, lags).clip(0)).astype(dtype)
+    yb = np.matmul(T, v)
+    if n_groups > 1:
+        # Output of the last block of each group, then carried forward
+        last = lfilter([1.], [1., -pole ** group], yb[:, -1], axis=0)
+        for i in range(group):
+            yb[1:, i] += pole ** (i + 1) * last[:-1]
+    y = yb.reshape((-1,) + rest)[:n]
+    # State for the next delay samples: -g*x[m] + p*y[m] for m = n-delay+i,
+    # or the initial state if m < 0
+    zf = np.empty((delay,) + rest, dtype=np.result_type(z.dtype, dtype))
+    zf[:delay-head] = z[head:]
+    zf[delay-head:] = pole * y[n-head:] - gain * x[n-head:]
+    return y, zf
+
+def comb_filtfilt(x, delay, gain, pole, padlen=None):
+    """Forward-backward (zero-phase) comb filtering along the first axis.
+
+    Equivalent to scipy.signal.filtfilt with odd padding applied to the
+    dense comb filter coefficients, at a fraction of the cost.
+
+    Parameters
+    ----------
+
+    x : array, shape = (n_samples, ...)
+        Signal to be filtered.
+    delay, gain, pole : int, float, float
+        Filter coefficients (see comb_coefficients).
+    padlen : int, optional
+        Edge padding length. Defaults to 3*(delay+1), as filtfilt.
+    """
+    x = np.asarray(x)
+    if padlen is None:
+        padlen = 3 * (delay + 1)
+    padlen = int(np.minimum(padlen, x.shape[0] - 1))
+    ext = odd_ext(x, padlen)
+    y, __ = comb_filter(ext, delay, gain, pole, zi=comb_filter_zi(ext[0], gain, delay))
+    # The backward pass reads the reversed output as a view; only the
+    # trimmed result is copied back into forward order
+    y, __ = comb_filter(y[::-1], delay, gain, pole, zi=comb_filter_zi(y[-1], gain, delay))
+    return np.ascontiguousarray(y[ext.shape[0]-padlen-1:padlen-1 if padlen > 0 else None:-1])
+
+def odd_ext(x, padlen):
+    """Odd extension of x by padlen samples at both ends of the first axis."""
+    if padlen < 1:
+        return x
+    left = 2 * x[0] - x[padlen:0:-1]
+    right = 2 * x[-1] - x[-2:-(padlen + 2):-1]
+    return np.concatenate((left, x, right))
+
+def sosfilt_chunked(sos, x, out=None, chunk_size=65536):
+    """Causal filtering along the first axis, processing x in chunks.
+
+    Only one chunk is held in memory at a time, hence x and out can be
+    memory-mapped arrays of arbitrary length.
+
+    Parameters
+    ----------
+
+    sos : array, shape = (n_sections, 6)
+        Filter coefficients in second-order sections.
+    x : array, shape = (n_samples, ...)
+        Signal to be filtered (e.g. numpy.memmap).
+    out : array or str, optional
+        Output array of the same shape as x (e.g. numpy.memmap), or the path
+        of a .npy file to be created as a memory-mapped output.
+    chunk_size : int, optional (default 65536)
+        Number of samples processed at a time.
+
+    Returns
+    -------
+
+    y : array
+        Filtered signal (out, if provided).
+    """
+    out = allocate_output(x, out)
+    z = np.zeros((sos.shape[0], 2) + x.shape[1:])
+    for start in range(0, x.shape[0], chunk_size):
+        stop = min(start + chunk_size, x.shape[0])
+        out[start:stop], z = sosfilt(sos, x[start:stop], axis=0, zi=z)
+    return out
+
+def sosfiltfilt_chunked(sos, x, out=None, chunk_size=65536, padlen=None):
+    """Forward-backward (zero-phase) filtering along the first axis,
+    processing x in chunks.
+
+    The filter state is handed over between consecutive chunks (forwards,
+    then backwards over the output), hence the result is the same as that of
+    scipy.signal.sosfiltfilt with odd padding, while only one chunk is held
+    in memory at a time. The forward pass is stored in out.
+
+    Parameters
+    ----------
+
+    sos : array, shape = (n_sections, 6)
+        Filter coefficients in second-order sections.
+    x : array, shape = (n_samples, ...)
+        Signal to be filtered (e.g. numpy.memmap).
+    out : array or str, optional
+        Output array of the same shape as x (e.g. numpy.memmap), or the path
+        of a .npy file to be created as a memory-mapped output. It may be x
+        itself.
+    chunk_size : int, optional (default 65536)
+        Number of samples processed at a time.
+    padlen : int, optional
+        Edge padding length. Defaults to that of scipy.signal.sosfiltfilt.
+
+    Returns
+    -------
+
+    y : array
+        Filtered signal (out, if provided).
+    """
+    n = x.shape[0]
+    if padlen is None:
+        n_zeros = min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+        padlen = 3 * (2 * sos.shape[0] + 1 - n_zeros)
+    padlen = int(np.minimum(padlen, n - 1))
+    zi = sosfilt_zi(sos).reshape((sos.shape[0], 2) + (1,) * (x.ndim - 1))
+    head = np.asarray(x[:padlen + 1], dtype=float)
+    tail = np.asarray(x[n - padlen - 1:], dtype=float)
+    left = odd_ext(head, padlen)[:padlen]
+    right = odd_ext(tail, padlen)[tail.shape[0] + padlen:]
+    out = allocate_output(x, out)
+
+    # Forward pass
+    z = zi * (left[0] if padlen > 0 else head[0])
+    if padlen > 0:
+        __, z = sosfilt(sos, left, axis=0, zi=z)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        out[start:stop], z = sosfilt(sos, x[start:stop], axis=0, zi=z)
+
+    # Backward pass
+    if padlen > 0:
+        y_right, __ = sosfilt(sos, right, axis=0, zi=z)
+        __, z = sosfilt(sos, y_right[::-1], axis=0, zi=zi * y_right[-1])
+    else:
+        z = zi * np.asarray(out[-1], dtype=float)
+    for stop in range(n, 0, -chunk_size):
+        start = max(stop - chunk_size, 0)
+        y, z = sosfilt(sos, out[start:stop][::-1], axis=0, zi=z)
+        out[start:stop] = y[::-1]
+    return out
+
+def allocate_output(x, out):
+    """Returns the output array for filtering x: out itself if it is an
+    array, a new memory-mapped .npy file if out is a path, otherwise a new
+    array (float32 for float32 input, float64 otherwise)."""
+    if out is None:
+        return np.empty(x.shape, dtype=np.result_type(x.dtype, np.float32))
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', shape=x.shape,
+                                         dtype=np.result_type(x.dtype, np.float32))
+    if out.shape != x.shape:
+        raise ValueError('Output array must have the same shape as x.')
+    return out
+
+def filter_channels(func, x, out=None, n_jobs=None):
+    """Applies a filter to blocks of channels (columns) of x in parallel.
+
+    The channels are split into n_jobs contiguous blocks which are filtered
+    by a pool of threads (SciPy filtering routines release the GIL) and
+    written into a shared output array.
+
+    Parameters
+    ----------
+
+    func : callable
+        func(x_block, out_block) filters x_block, of shape
+        (n_samples, n_block_channels), along the first axis and writes the
+        result into out_block.
+    x : array, shape = (n_samples, n_channels)
+        Signal to be filtered.
+    out : array, optional
+        Output array of the same shape as x. It may be x itself.
+    n_jobs : int, optional
+        Number of threads. Defaults to the number of CPUs.
+
+    Returns
+    -------
+
+    y : array
+        Filtered signal (out, if provided).
+    """
+    x = np.asarray(x)
+    if out is None:
+        out = np.empty(x.shape, dtype=np.result_type(x.dtype, np.float64))
+    n_jobs = cpu_count() if n_jobs is None else n_jobs
+    if x.ndim == 1 or n_jobs == 1 or x.shape[1] == 1:
+        func(x, out)
+        return out
+    bounds = np.linspace(0, x.shape[1], min(n_jobs, x.shape[1]) + 1).astype(int)
+    blocks = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    pool = ThreadPool(len(blocks))
+    try:
+        pool.map(lambda block: func(x[:, block], out[:, block]), blocks)
+    finally:
+        pool.close()
+        pool.join()
+    return out
@@ -6,11 +6,14 @@ Created on Sat Mar 19 15:02:44 2016
 """
 
 from scipy.signal import butter, filtfilt
+from pyEMG.filters_utils import filter_channels
 
-def glove_filter_lowpass(x, order = 4, sRate = 2000., highcut = 1.):
-    """ Forward-backward band-pass filtering (IIR butterworth filter) """
+def glove_filter_lowpass(x, order = 4, sRate = 2000., highcut = 1., n_jobs = 1):
+    """ Forward-backward band-pass filtering (IIR butterworth filter).
+        Channels are filtered in n_jobs threads (all CPUs if None). """
     nyq = 0.5 * sRate
     high = highcut/nyq
     b, a = butter(order, high, btype = 'low')
-    filtered = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd')
-    return filtered
\ No newline at end of file
+    def _filter(x, out):
+        out[...] = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd')
+    return filter_channels(_filter, x, n_jobs=n_jobs)
\ No newline at end of file
@@ -7,39 +7,52 @@ Created on Thu Mar 31 14:29:55 2016
 
 import numpy as np
 from scipy.signal import butter, filtfilt
+from pyEMG.filters_utils import comb_coefficients, comb_filtfilt, filter_channels
 
-def imu_filter_lowpass(x, order = 4, sRate = 148.148148148148, highcut = 20.0):
-    """ Forward-backward band-pass filtering (IIR butterworth filter) """
+def imu_filter_lowpass(x, order = 4, sRate = 148.148148148148, highcut = 20.0, n_jobs = 1):
+    """ Forward-backward band-pass filtering (IIR butterworth filter).
+        Channels are filtered in n_jobs threads (all CPUs if None). """
     nyq = 0.5 * sRate
     high = highcut/nyq
     b, a = butter(N =order, Wn = high, btype = 'low')
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
-                    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1))
+    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1)
+    def _filter(x, out):
+        out[...] = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
+                            padlen = padlen)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
     
-def imu_filter_highpass(x, order = 4, sRate = 148.148148148148, lowcut = 0.01):
-    """ Forward-backward band-pass filtering (IIR butterworth filter) """
+def imu_filter_highpass(x, order = 4, sRate = 148.148148148148, lowcut = 0.01, n_jobs = 1):
+    """ Forward-backward band-pass filtering (IIR butterworth filter).
+        Channels are filtered in n_jobs threads (all CPUs if None). """
     nyq = 0.5 * sRate
     low = lowcut/nyq
     b, a = butter(N =order, Wn = low, btype = 'high')
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
-                    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1))
+    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1)
+    def _filter(x, out):
+        out[...] = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
+                            padlen = padlen)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
     
-def imu_filter_bandpass(x, order = 4, sRate = 148.148148148148, lowcut = 1., highcut = 20.):
-    """ Forward-backward band-pass filtering (IIR butterworth filter) """
+def imu_filter_bandpass(x, order = 4, sRate = 148.148148148148, lowcut = 1., highcut = 20., n_jobs = 1):
+    """ Forward-backward band-pass filtering (IIR butterworth filter).
+        Channels are filtered in n_jobs threads (all CPUs if None). """
     nyq = 0.5 * sRate
     low = lowcut/nyq
     high = highcut/nyq
     b, a = butter(N =order, Wn = [low, high], btype = 'band')
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
-                    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1))
+    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1)
+    def _filter(x, out):
+        out[...] = filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
+                            padlen = padlen)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
     
-def imu_filter_comb(x):
-    """ Comb filtering at 50 Hz. Coefficients are computed with MATLAB."""
-    b = np.zeros(41)
-    a = np.zeros(41)
-    b[0] = 0.941160767899653
-    b[-1] = -0.941160767899653
-    a[0] = 1.
-    a[-1] = -0.882321535799305
-    return filtfilt(b=b, a=a, x=x, axis=0, method = 'pad', padtype = 'odd',
-    padlen = np.minimum(3*len(a)*len(b), x.shape[0]-1))
\ No newline at end of file
+def imu_filter_comb(x, sRate = 2000., mains = 50., bandwidth = None, n_jobs = 1):
+    """ Forward-backward comb filtering at the mains frequency (50 Hz by
+        default). The default sampling frequency and bandwidth are those of
+        the coefficients originally computed with MATLAB. Channels are
+        filtered in n_jobs threads (all CPUs if None). """
+    delay, gain, pole = comb_coefficients(sRate, mains, bandwidth)
+    padlen = np.minimum(3*(delay+1)**2, x.shape[0]-1)
+    def _filter(x, out):
+        out[...] = comb_filtfilt(x, delay, gain, pole, padlen = padlen)
+    return filter_channels(_filter, x, n_jobs=n_jobs)
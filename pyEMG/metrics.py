@@ -1,11 +1,13 @@
 import numpy as np
 from sklearn.metrics import accuracy_score, log_loss
+from pyEMG.segments import SegmentIndex
 
 def _check_x_y(true,pred):
     if true.shape != pred.shape:
         raise ValueError('True and predicted signals must be of the same size.')
 
-def vaf_score(true,pred):
+def _sum_squares(true, pred):
+    """Returns the residual and total sums of squares of each output."""
     true = np.asarray(true)
     pred = np.asarray(pred)
     _check_x_y(true,pred)
@@ -16,124 +18,240 @@ def vaf_score(true,pred):
     if pred.ndim == 1:
         pred = pred.reshape((1,pred.shape[0]))
 
-    n_sam, n_pred = true.shape
-    ss_err = np.zeros(n_pred)
-    ss_tot = np.zeros(n_pred)
-    vaf = np.zeros(n_pred)
-    for jj in range(n_pred):
-        ss_err[jj] = np.sum((true[:,jj]-pred[:,jj])**2)
-        ss_tot[jj] = np.sum((true[:,jj]-np.mean(true[:,jj]))**2)
-        vaf[jj] = 1 - (ss_err[jj]/ss_tot[jj])
+    # Column reductions with einsum avoid the temporaries of (x**2).sum(axis=0)
+    err = np.subtract(true, pred, dtype=float)
+    ss_err = np.einsum('ij,ij->j', err, err)
+    np.subtract(true, np.einsum('ij->j', true) / true.shape[0], out=err)
+    ss_tot = np.einsum('ij,ij->j', err, err)
+    return ss_err, ss_tot
 
-    return vaf
+def vaf_score(true,pred):
+    ss_err, ss_tot = _sum_squares(true, pred)
+    return 1 - ss_err/ss_tot
 
 
 def vaf_mv_score(true, pred):
-    true = np.asarray(true)
-    pred = np.asarray(pred)
-    _check_x_y(true,pred)
+    ss_err, ss_tot = _sum_squares(true, pred)
+    return 1 - np.sum(ss_err)/np.sum(ss_tot)
 
-    # If input arrays are single-dimensional, reshape them
-    if true.ndim == 1:
-        true = true.reshape((1,true.shape[0]))
-    if pred.ndim == 1:
-        pred = pred.reshape((1,pred.shape[0]))
 
-    n_sam, n_pred = true.shape
-    ss_err = np.zeros(n_pred)
-    ss_tot = np.zeros(n_pred)
-    for jj in range(n_pred):
-        ss_err[jj] = np.sum((true[:,jj]-pred[:,jj])**2)
-        ss_tot[jj] = np.sum((true[:,jj]-np.mean(true[:,jj]))**2)
+class VafAccumulator(object):
+    """Streaming variance accounted for.
 
-    vaf_mv = 1 - np.sum(ss_err)/np.sum(ss_tot)
-    return vaf_mv
+    Residual sums of squares are summed and the mean and total sum of
+    squares of the targets are updated with running moments (Chan et al.
+    pairwise update), so that predictions can be evaluated chunk by chunk
+    without being kept in memory. The result equals vaf_score and
+    vaf_mv_score on the concatenated data.
 
-def balanced_accuracy_score(y_true, y_pred, method = 'edges', random_state=None):
-    """Balanced classification accuracy metric (multi-class).
-    Keeps only a subset of the data instances corresponding to the rest class.
-    The size of the subset is equal to the median group size of the other
-    classes."""
+    Parameters
+    ----------
 
-    _check_x_y(y_true,y_pred)
-    classes, n_instances = np.unique(y_true, return_counts=True)
-    median_instances = np.median(n_instances[1:])
-    n_classes = classes.size
+    n_pred : int
+        Number of outputs.
 
-    idx_rest = np.where(y_true == 0)[0] # Find rest instances
-    idx_else = np.where(y_true != 0)[0] # Find all other instances
+    Attributes
+    ----------
 
-    if method == 'random':
-        if random_state is not None:
-            np.random.seed(random_state)
-        idx_keep = np.random.choice(idx_rest,median_instances, replace=False) # Keep a random subset
-        idx_final = np.sort(np.hstack((idx_keep, idx_else)))
+    n_ : int
+        Number of samples seen.
+    mean_ : array, shape = (n_pred,)
+        Mean of targets.
+    ss_tot_ : array, shape = (n_pred,)
+        Sum of squared deviations of targets from their mean.
+    ss_err_ : array, shape = (n_pred,)
+        Sum of squared prediction errors.
+    """
 
+    def __init__(self, n_pred):
+        self.n_pred = n_pred
+        self.reset()
 
-    if method == 'edges':
-        samples_per_rest_repetition = np.fix(median_instances / (2*n_classes - 1)).astype('int'); # How many we want to keep for each rest repetition
-        if samples_per_rest_repetition < 1:
-            samples_per_rest_repetition = 1;
+    def reset(self):
+        self.n_ = 0
+        self.mean_ = np.zeros(self.n_pred)
+        self.ss_tot_ = np.zeros(self.n_pred)
+        self.ss_err_ = np.zeros(self.n_pred)
 
-        changes = np.diff(y_true) # Stimulus change
-        idx_changes = np.nonzero(changes)[0] # Stimulus change
-        idx_from_rest = idx_changes[np.arange(start=0,stop=idx_changes.size,step=2)] # Changing from rest to movement
-        idx_to_rest = idx_changes[np.arange(start=1,stop=idx_changes.size,step=2)] # Changing from rest to movement
-        idx_to_rest = np.hstack(([0], idx_to_rest))
+    def update(self, true, pred):
+        """Adds a chunk of targets and predictions, shape = (n_samples,
+        n_pred). One-dimensional inputs are taken as a single sample."""
+        true = np.asarray(true, dtype=float)
+        pred = np.asarray(pred, dtype=float)
+        _check_x_y(true,pred)
+        if true.ndim == 1:
+            true = true.reshape((1,true.shape[0]))
+            pred = pred.reshape((1,pred.shape[0]))
+        n = true.shape[0]
+        if n == 0:
+            return self
+        err = true - pred
+        self.ss_err_ += np.einsum('ij,ij->j', err, err)
+        mean = np.einsum('ij->j', true) / n
+        np.subtract(true, mean, out=err)
+        ss_tot = np.einsum('ij,ij->j', err, err)
+        n_total = self.n_ + n
+        delta = mean - self.mean_
+        self.ss_tot_ += ss_tot + delta**2 * self.n_ * n / n_total
+        self.mean_ += delta * n / n_total
+        self.n_ = n_total
+        return self
 
-        idx_keep = []
-        for ii,jj in zip(idx_to_rest,idx_from_rest):
-            center = np.fix(ii + (jj-ii)/2)
-            idx_keep.extend(np.arange(center,center+samples_per_rest_repetition))
-        idx_keep = np.asarray(idx_keep, dtype='int')
-        idx_final = np.sort(np.hstack((idx_keep, idx_else)))
+    def vaf(self):
+        """Variance accounted for, for each output."""
+        return 1 - self.ss_err_/self.ss_tot_
 
-    true_new = y_true[idx_final]
-    pred_new = y_pred[idx_final]
+    def vaf_mv(self):
+        """Multivariate variance accounted for."""
+        return 1 - np.sum(self.ss_err_)/np.sum(self.ss_tot_)
 
-    return accuracy_score(true_new, pred_new)
+def balanced_indexes(y_true, method='edges', random_state=None, index=None):
+    """Indexes of the instances used by the balanced metrics.
 
-def balanced_log_loss(y_true, y_pred, method = 'edges', random_state=None):
-    """Balanced log-loss metric (multi-class).
-    Keeps only a subset of the data instances corresponding to the rest class.
-    The size of the subset is equal to the median group size of the other
-    classes."""
+    Keeps only a subset of the data instances corresponding to the rest class
+    (label 0). The size of the subset is equal to the median group size of
+    the other classes. The indexes are sorted and can be computed once and
+    passed to the balanced metrics or to BalancedMetricAccumulator.
 
-#    y_true = np.asarray(y_true)
-#    y_pred = np.asarray(y_pred)
-    classes, n_instances = np.unique(y_true, return_counts=True)
+    Parameters
+    ----------
+
+    y_true : array, shape = (n_samples,)
+        Class labels.
+    method : {'edges', 'random'}
+        'edges' keeps instances at the centre of each rest segment, 'random'
+        keeps a random subset of rest instances.
+    random_state : int, optional
+        Seed of the 'random' method.
+    index : SegmentIndex, optional
+        Precomputed segment index of y_true.
+    """
+    y_true = np.asarray(y_true)
+    if index is None:
+        index = SegmentIndex(y_true)
+    classes, n_instances = index.label_counts()
     median_instances = np.median(n_instances[1:])
     n_classes = classes.size
 
-    idx_rest = np.where(y_true == 0)[0] # Find rest instances
-    idx_else = np.where(y_true != 0)[0] # Find all other instances
+    idx_else = np.nonzero(y_true != 0)[0] # Find all other instances
 
     if method == 'random':
+        idx_rest = np.nonzero(y_true == 0)[0] # Find rest instances
         if random_state is not None:
             np.random.seed(random_state)
-        idx_keep = np.random.choice(idx_rest,median_instances, replace=False) # Keep a random subset
-        idx_final = np.sort(np.hstack((idx_keep, idx_else)))
+        idx_keep = np.random.choice(idx_rest, int(median_instances), replace=False) # Keep a random subset
+    elif method == 'edges':
+        samples_per_rest_repetition = max(1, int(np.fix(median_instances / (2*n_classes - 1)))) # How many we want to keep for each rest repetition
+
+        idx_changes = index.label_changes() - 1 # Stimulus change
+        idx_from_rest = idx_changes[0::2] # Changing from rest to movement
+        idx_to_rest = np.hstack(([0], idx_changes[1::2])) # Changing from movement to rest
+        n_rest = idx_from_rest.size
+        centers = np.fix(idx_to_rest[:n_rest] + (idx_from_rest - idx_to_rest[:n_rest])/2).astype('int')
+        idx_keep = (centers[:, np.newaxis] + np.arange(samples_per_rest_repetition)).reshape(-1)
+    else:
+        raise ValueError("method must be 'edges' or 'random'.")
+    return np.sort(np.hstack((idx_keep, idx_else)).astype('int'))
+
+def balanced_accuracy_score(y_true, y_pred, method = 'edges', random_state=None, indexes=None):
+    """Balanced classification accuracy metric (multi-class).
+    Keeps only a subset of the data instances corresponding to the rest class.
+    The size of the subset is equal to the median group size of the other
+    classes. Precomputed indexes (see balanced_indexes) can be passed to
+    avoid analysing y_true at every call."""
+
+    _check_x_y(y_true,y_pred)
+    if indexes is None:
+        indexes = balanced_indexes(y_true, method, random_state)
+    return accuracy_score(y_true[indexes], y_pred[indexes])
+
+def balanced_log_loss(y_true, y_pred, method = 'edges', random_state=None, indexes=None):
+    """Balanced log-loss metric (multi-class).
+    Keeps only a subset of the data instances corresponding to the rest class.
+    The size of the subset is equal to the median group size of the other
+    classes. Precomputed indexes (see balanced_indexes) can be passed to
+    avoid analysing y_true at every call."""
+
+    if indexes is None:
+        indexes = balanced_indexes(y_true, method, random_state)
+    return log_loss(y_true[indexes], y_pred[indexes])
+
+
+class BalancedMetricAccumulator(object):
+    """Streaming balanced accuracy and log-loss.
+
+    The instances kept by the balanced metrics are given once as indexes into
+    the whole recording. Predictions are then passed chunk by chunk, in
+    order, and only a confusion matrix and the sum of log-losses are kept.
+
+    Parameters
+    ----------
+
+    indexes : array
+        Sorted indexes of the kept instances, as returned by
+        balanced_indexes.
+    classes : array-like
+        Sorted class labels. Columns of probability predictions follow this
+        order.
+
+    Attributes
+    ----------
+
+    confusion_ : array, shape = (n_classes, n_classes)
+        Counts of kept instances, true classes along rows.
+    log_loss_sum_ : float
+        Sum of log-losses of kept instances with probability predictions.
+    n_proba_ : int
+        Number of kept instances with probability predictions.
+    """
+
+    def __init__(self, indexes, classes):
+        self.indexes = np.asarray(indexes, dtype=int)
+        self.classes = np.asarray(classes)
+        self.reset()
 
+    def reset(self):
+        n_classes = self.classes.size
+        self.confusion_ = np.zeros((n_classes, n_classes), dtype=int)
+        self.log_loss_sum_ = 0.
+        self.n_proba_ = 0
+        self._pos = 0
 
-    if method == 'edges':
-        samples_per_rest_repetition = np.fix(median_instances / (2*n_classes - 1)).astype('int'); # How many we want to keep for each rest repetition
-        if samples_per_rest_repetition < 1:
-            samples_per_rest_repetition = 1;
+    def update(self, y_true, y_pred=None, y_proba=None):
+        """Adds the next chunk of labels and predictions.
 
-        changes = np.diff(y_true) # Stimulus change
-        idx_changes = np.nonzero(changes)[0] # Stimulus change
-        idx_from_rest = idx_changes[np.arange(start=0,stop=idx_changes.size,step=2)] # Changing from rest to movement
-        idx_to_rest = idx_changes[np.arange(start=1,stop=idx_changes.size,step=2)] # Changing from rest to movement
-        idx_to_rest = np.hstack(([0], idx_to_rest))
+        Parameters
+        ----------
 
-        idx_keep = []
-        for ii,jj in zip(idx_to_rest,idx_from_rest):
-            center = np.fix(ii + (jj-ii)/2)
-            idx_keep.extend(np.arange(center,center+samples_per_rest_repetition))
-        idx_keep = np.asarray(idx_keep, dtype='int')
-        idx_final = np.sort(np.hstack((idx_keep, idx_else)))
+        y_true : array, shape = (n_samples,)
+            Class labels of the chunk.
+        y_pred : array, shape = (n_samples,), optional
+            Predicted labels.
+        y_proba : array, shape = (n_samples, n_classes), optional
+            Predicted class probabilities.
+        """
+        y_true = np.asarray(y_true)
+        n = y_true.shape[0]
+        start, stop = np.searchsorted(self.indexes, [self._pos, self._pos + n])
+        kept = self.indexes[start:stop] - self._pos
+        self._pos += n
+        true = np.searchsorted(self.classes, y_true[kept])
+        n_classes = self.classes.size
+        if y_pred is not None:
+            pred = np.searchsorted(self.classes, np.asarray(y_pred)[kept])
+            self.confusion_ += np.bincount(true * n_classes + pred,
+                                           minlength=n_classes**2).reshape((n_classes, n_classes))
+        if y_proba is not None:
+            eps = np.finfo(float).eps
+            proba = np.asarray(y_proba, dtype=float)[kept, true]
+            self.log_loss_sum_ -= np.sum(np.log(np.clip(proba, eps, 1 - eps)))
+            self.n_proba_ += kept.size
+        return self
 
-    true_new = y_true[idx_final]
-    pred_new = y_pred[idx_final]
+    def accuracy(self):
+        """Balanced accuracy of the predictions seen."""
+        return np.trace(self.confusion_) / float(np.sum(self.confusion_))
 
-    return log_loss(true_new, pred_new)
+    def log_loss(self):
+        """Balanced log-loss of the probability predictions seen."""
+        return self.log_loss_sum_ / self.n_proba_
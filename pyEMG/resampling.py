@@ -0,0 +1,163 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+from fractions import Fraction
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+# Anti-aliasing filter designs, keyed by (up, down)
+_FILTERS = dict()
+
+def rational_ratio(sRate_in, sRate_out, max_denominator=1000):
+    """Returns the up-sampling and down-sampling factors of a rational
+    approximation of sRate_out / sRate_in.
+
+    For example, the Trigno IMU rate (148.148 Hz) is converted to 2 kHz with
+    up = 27 and down = 2."""
+    ratio = Fraction(sRate_out / sRate_in).limit_denominator(max_denominator)
+    return ratio.numerator, ratio.denominator
+
+def polyphase_filter(up, down):
+    """Anti-aliasing FIR filter used for rational resampling, as designed by
+    scipy.signal.resample_poly (Kaiser window, beta 5). Designs are cached."""
+    if (up, down) not in _FILTERS:
+        max_rate = max(up, down)
+        half_len = 10 * max_rate
+        _FILTERS[(up, down)] = firwin(2 * half_len + 1, 1. / max_rate,
+                                      window=('kaiser', 5.0))
+    return _FILTERS[(up, down)]
+
+def resample(x, sRate_in, sRate_out, max_denominator=1000):
+    """Resamples x along the first axis with polyphase filtering.
+
+    Parameters
+    ----------
+
+    x : array, shape = (n_samples, ...)
+        Signal to be resampled.
+
+    sRate_in : float
+        Sampling frequency of x (Hz).
+
+    sRate_out : float
+        Target sampling frequency (Hz).
+
+    max_denominator : int, optional (default 1000)
+        Largest resampling factor used for approximating sRate_out/sRate_in.
+
+    Returns
+    -------
+
+    y : array, shape = (n_samples * up / down, ...)
+        Resampled signal.
+
+    """
+    up, down = rational_ratio(sRate_in, sRate_out, max_denominator)
+    if up == down:
+        return np.asarray(x)
+    return resample_poly(x, up, down, axis=0, window=polyphase_filter(up, down))
+
+class Resampler(object):
+    """Polyphase resampler for streamed data.
+
+    Each output sample is produced as soon as all input samples it depends on
+    have been received, i.e. with a latency of half the filter length. The
+    concatenated outputs are the same as those of resample() applied to the
+    whole signal (apart from the last samples, which are still pending).
+    Only the last few input samples are kept between calls. If the two rates
+    are equal (up == down), chunks are passed through unchanged.
+
+    Parameters
+    ----------
+
+    n_channels : int
+        Number of channels (columns) of the signal.
+
+    sRate_in : float
+        Sampling frequency of the input (Hz).
+
+    sRate_out : float
+        Target sampling frequency (Hz).
+
+    max_denominator : int, optional (default 1000)
+        Largest resampling factor used for approximating sRate_out/sRate_in.
+
+    Attributes
+    ----------
+
+    up, down : int
+        Resampling factors.
+
+    n_in_ : int
+        Number of input samples received.
+
+    n_out_ : int
+        Number of output samples produced.
+
+    """
+
+    def __init__(self, n_channels, sRate_in, sRate_out, max_denominator=1000):
+        self.n_channels = n_channels
+        self.sRate_in = sRate_in
+        self.sRate_out = sRate_out
+        self.up, self.down = rational_ratio(sRate_in, sRate_out, max_denominator)
+        if self.up == self.down:
+            self._n_taps = 0
+            self.reset()
+            return
+        h = polyphase_filter(self.up, self.down) * self.up
+        self._half_len = (h.size - 1) // 2
+        self._n_taps = int(np.ceil(h.size / self.up))
+        # Polyphase components: row i holds the taps h[p + up*i] of phase p
+        self._phases = np.zeros(self._n_taps * self.up)
+        self._phases[:h.size] = h
+        self._phases = self._phases.reshape((self._n_taps, self.up))
+        self.reset()
+
+    def reset(self):
+        """Resets the resampler (the signal is zero before the first sample)."""
+        self._history = np.zeros((self._n_taps, self.n_channels))
+        self.n_in_ = 0
+        self.n_out_ = 0
+
+    def resample(self, x):
+        """Resamples a new chunk of data.
+
+        Parameters
+        ----------
+
+        x : array, shape = (n_samples, n_channels) or (n_channels,)
+            Most recent samples. A 1D array is treated as a single sample.
+
+        Returns
+        -------
+
+        y : array, shape = (n_out, n_channels)
+            Output samples that have become available (possibly none).
+
+        """
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            x = x[np.newaxis, :]
+        if x.shape[1] != self.n_channels:
+            raise ValueError("Data must have {} channels.".format(self.n_channels))
+        if self.up == self.down:
+            self.n_in_ += x.shape[0]
+            self.n_out_ += x.shape[0]
+            return x
+        buf = np.concatenate((self._history, x))
+        offset = self.n_in_ - self._n_taps # Input index of buf[0]
+        self.n_in_ += x.shape[0]
+
+        # Outputs whose most recent input sample has been received
+        n_max = (self.n_in_ * self.up - 1 - self._half_len) // self.down
+        n = np.arange(self.n_out_, max(n_max + 1, self.n_out_))
+        m = n * self.down + self._half_len # Up-sampled time of each output
+        newest = m // self.up - offset
+        phase = m % self.up
+        y = np.zeros((n.size, self.n_channels))
+        for i in range(self._n_taps):
+            y += self._phases[i, phase][:, np.newaxis] * buf[newest - i]
+        self.n_out_ += n.size
+        self._history = buf[-self._n_taps:]
+        return y
@@ -0,0 +1,104 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+
+class SegmentIndex(object):
+    """Run-length index of label vectors.
+
+    The recording is split into segments of constant label (e.g. stimulus)
+    and repetition. Segments are found with a single pass over the labels;
+    consumers then query the (few) segment records instead of rescanning the
+    (many) label samples.
+
+    Parameters
+    ----------
+
+    labels : array, shape = (n_samples,) or (n_samples, 1)
+        Label vector, e.g. stimulus or restimulus.
+
+    repetition : array, shape = (n_samples,) or (n_samples, 1), optional
+        Repetition vector.
+
+    Attributes
+    ----------
+
+    label : array, shape = (n_segments,)
+        Label of each segment.
+    repetition : array, shape = (n_segments,)
+        Repetition of each segment (zeros if not given).
+    start, stop : array, shape = (n_segments,)
+        First sample and one past the last sample of each segment.
+    n_samples : int
+        Length of the label vector.
+    """
+
+    def __init__(self, labels, repetition=None):
+        labels = self._check_labels(labels)
+        changes = labels[1:] != labels[:-1]
+        if repetition is not None:
+            repetition = self._check_labels(repetition)
+            if repetition.size != labels.size:
+                raise ValueError('Labels and repetition must be of the same size.')
+            changes |= repetition[1:] != repetition[:-1]
+        self.n_samples = labels.size
+        self.start = np.hstack(([0], np.nonzero(changes)[0] + 1)) if labels.size else np.zeros(0, dtype=int)
+        self.stop = np.hstack((self.start[1:], [labels.size])) if labels.size else np.zeros(0, dtype=int)
+        self.label = labels[self.start]
+        self.repetition = np.zeros_like(self.label) if repetition is None else repetition[self.start]
+
+    def _check_labels(self, x):
+        x = np.asarray(x)
+        if x.ndim == 2 and x.shape[1] == 1:
+            x = x[:, 0]
+        if x.ndim != 1:
+            raise ValueError('Labels must be one-dimensional.')
+        return x
+
+    @property
+    def n_segments(self):
+        return self.start.size
+
+    @property
+    def lengths(self):
+        return self.stop - self.start
+
+    def find(self, label=None, repetition=None):
+        """Returns the indices of segments with the given label and/or
+        repetition."""
+        mask = np.ones(self.n_segments, dtype=bool)
+        if label is not None:
+            mask &= self.label == label
+        if repetition is not None:
+            mask &= self.repetition == repetition
+        return np.nonzero(mask)[0]
+
+    def bounds(self, label=None, repetition=None):
+        """Returns the (start, stop) rows of segments with the given label
+        and/or repetition."""
+        idx = self.find(label, repetition)
+        return np.column_stack((self.start[idx], self.stop[idx]))
+
+    def label_changes(self):
+        """Returns the first sample of every run of constant label (i.e.
+        ignoring repetition changes), the first one excluded."""
+        change = np.nonzero(self.label[1:] != self.label[:-1])[0] + 1
+        return self.start[change]
+
+    def label_counts(self):
+        """Returns the labels present and their number of samples, as
+        np.unique(labels, return_counts=True)."""
+        labels, inverse = np.unique(self.label, return_inverse=True)
+        return labels, np.bincount(inverse, weights=self.lengths).astype(int)
+
+    def first_nonzero(self, positions):
+        """Returns, for each position, the first sample at or after it with
+        a non-zero label (n_samples if there is none)."""
+        positions = np.asarray(positions, dtype=int)
+        active = self.label != 0
+        start, stop = self.start[active], self.stop[active]
+        j = np.searchsorted(stop, positions, side='right')
+        found = j < stop.size
+        out = np.full(positions.shape, self.n_samples, dtype=int)
+        out[found] = np.maximum(positions[found], start[j[found]])
+        return out
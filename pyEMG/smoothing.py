@@ -4,11 +4,17 @@
 
 from __future__ import division, print_function
 import numpy as np
-from pyEMG.time_buffer import Buffer
+from numpy.lib.stride_tricks import as_strided
 
 class MovingAverage(object):
     """Moving average smoother. 
     
+    The last k measurements are kept in a ring buffer. With uniform weights
+    a running sum is updated at every call (it is recomputed whenever the
+    ring wraps around, to avoid accumulating rounding errors); otherwise
+    the ring is multiplied by a view of the weights rotated to the current
+    ring position.
+    
     Parameters
     ----------
     
@@ -26,11 +32,22 @@ class MovingAverage(object):
     
     def __init__(self, shape, k, weights=None):
         
-        self.shape = shape
+        self.shape = tuple(shape)
         self.__check_k_weights(k, weights)
         self.k = k 
-        self.weights = np.ones((k,)) if weights is None else weights
-        self.buffer_ = Buffer(size=self.__get_buf_size())
+        self.weights = np.ones((k,)) if weights is None else np.asarray(weights, dtype=float)
+        self._uniform = bool(np.all(self.weights == self.weights[0]))
+        # Weights of ring slots for the most recent sample at slot p are
+        # _rotated[k-1-p:2k-1-p]
+        self._rotated = np.tile(self.weights[::-1], 2)
+        self.reset()
+
+    def reset(self):
+        """Clears past measurements (taken as zeros)."""
+        self._ring = np.zeros((self.k,) + self.shape)
+        self._ring_flat = self._ring.reshape((self.k, -1))
+        self._sum = np.zeros(self.shape)
+        self._pos = 0
         
     def smooth(self, x):
         
@@ -50,8 +67,56 @@ class MovingAverage(object):
             
         """
         
-        self.buffer_.push(x)
-        return np.dot(np.flipud(self.weights), self.buffer_.buffer) / self.k
+        x = np.asarray(x).reshape(self.shape)
+        k, p = self.k, self._pos
+        if self._uniform:
+            self._sum += x
+            self._sum -= self._ring[p]
+        self._ring[p] = x
+        self._pos = (p + 1) % k
+        if self._uniform:
+            if self._pos == 0:
+                np.sum(self._ring, axis=0, out=self._sum)
+            return self._sum * (self.weights[0] / k)
+        coef = self._rotated[k-1-p:2*k-1-p]
+        return np.dot(coef, self._ring_flat).reshape(self.shape) / k
+
+    def smooth_chunk(self, X):
+        """Smooths a block of consecutive measurements, as successive calls
+        to smooth.
+
+        Parameters
+        ----------
+
+        X : array, shape = (n_samples,) + shape
+            Raw measurements, oldest first.
+
+        Returns
+        -------
+
+        X_smoothed : array, shape = (n_samples,) + shape
+            Smoothed measurements.
+        """
+        X = np.asarray(X, dtype=float).reshape((-1,) + self.shape)
+        n, k = X.shape[0], self.k
+        if n == 0:
+            return X.copy()
+        # Past k-1 measurements (oldest first) followed by the block
+        history = np.concatenate((self._ring[self._pos:], self._ring[:self._pos]))
+        ext = np.concatenate((history[1:], X)).reshape((k - 1 + n, -1))
+        if self._uniform:
+            cumulative = np.zeros((ext.shape[0] + 1, ext.shape[1]))
+            np.cumsum(ext, axis=0, out=cumulative[1:])
+            Y = (cumulative[k:] - cumulative[:n]) * (self.weights[0] / k)
+        else:
+            # Row i of the view holds the window ending at sample i
+            windows = as_strided(ext, shape=(n, k, ext.shape[1]),
+                                 strides=(ext.strides[0],) + ext.strides)
+            Y = np.einsum('j,ijd->id', self.weights[::-1], windows) / k
+        self._ring_flat[...] = ext[-k:]
+        self._pos = 0
+        np.sum(self._ring, axis=0, out=self._sum)
+        return Y.reshape((n,) + self.shape)
     
     def __check_k_weights(self, k, weights):
         
@@ -63,12 +128,6 @@ class MovingAverage(object):
             if weights.ndim != 1 or weights.size != k:
                 raise ValueError("Weight array must have shape ({},)".format(k))
 
-    def __get_buf_size(self):
-        """Returns a flattened tuple to be used as the buffer size."""
-        
-        return tuple(np.append(self.k, 
-                               np.asarray([element for element in self.shape])))
-        
 
 class ExponentialSmoothing(object):
     
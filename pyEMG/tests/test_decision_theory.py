@@ -0,0 +1,37 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+from pyEMG.decision_theory import RocThreshold, IncrementalRocThreshold
+
+def _probabilities(n_samples=20000, n_classes=3, seed=0):
+    rng = np.random.RandomState(seed)
+    y = rng.randint(n_classes, size=n_samples)
+    logits = rng.randn(n_samples, n_classes) + 1.5 * np.eye(n_classes)[y]
+    p = np.exp(logits)
+    return y, p / np.sum(p, axis=1, keepdims=True)
+
+def _thresholds(roc):
+    return np.array([roc.optimal_threshold_[i] for i in range(len(roc.optimal_threshold_))])
+
+def test_incremental_max_random_is_youden_index():
+    y, p = _probabilities()
+    incremental = IncrementalRocThreshold(np.arange(3), n_bins=1000)
+    for batch in np.array_split(np.arange(y.size), 10):
+        incremental.partial_fit(y[batch], p[batch])
+    roc = RocThreshold()
+    roc.fit(y, p)
+    # Maximum of tpr - fpr over the exact ROC curves
+    youden = np.array([roc.thresholds_[i][np.argmax(roc.tpr_[i] - roc.fpr_[i])]
+                       for i in range(3)])
+    np.testing.assert_allclose(_thresholds(incremental), youden, atol=1e-2)
+
+def test_incremental_rules_match_batch():
+    y, p = _probabilities()
+    for method in ['min_perfect', 'custom']:
+        incremental = IncrementalRocThreshold(np.arange(3), method=method, n_bins=1000)
+        for batch in np.array_split(np.arange(y.size), 10):
+            incremental.partial_fit(y[batch], p[batch])
+        roc = RocThreshold(method=method)
+        roc.fit(y, p)
+        np.testing.assert_allclose(_thresholds(incremental), _thresholds(roc), atol=5e-3)
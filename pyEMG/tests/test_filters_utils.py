@@ -0,0 +1,52 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+from scipy.signal import lfilter, filtfilt
+from pyEMG.filters_utils import comb_coefficients, comb_filter, comb_filtfilt
+
+def _dense_comb(delay, gain, pole):
+    """Dense transfer function coefficients of the comb filter."""
+    b = np.zeros(delay + 1)
+    a = np.zeros(delay + 1)
+    b[0], b[-1] = gain, -gain
+    a[0], a[-1] = 1., -pole
+    return b, a
+
+def test_comb_filter_matches_lfilter():
+    delay, gain, pole = comb_coefficients()
+    b, a = _dense_comb(delay, gain, pole)
+    x = np.random.RandomState(0).randn(5003, 3)
+    y, __ = comb_filter(x, delay, gain, pole)
+    np.testing.assert_allclose(y, lfilter(b, a, x, axis=0), atol=1e-12)
+
+def test_comb_filter_streaming():
+    delay, gain, pole = comb_coefficients()
+    b, a = _dense_comb(delay, gain, pole)
+    x = np.random.RandomState(1).randn(3000, 2)
+    # Chunks shorter than, equal to and longer than the delay
+    bounds = np.cumsum([0, 1, 7, 39, 40, 41, 80, 1281, 3])
+    bounds = np.append(bounds, x.shape[0])
+    z = None
+    chunks = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        y, z = comb_filter(x[start:stop], delay, gain, pole, zi=z)
+        chunks.append(y)
+    np.testing.assert_allclose(np.concatenate(chunks), lfilter(b, a, x, axis=0), atol=1e-12)
+
+def test_comb_filter_short_input():
+    delay, gain, pole = comb_coefficients()
+    b, a = _dense_comb(delay, gain, pole)
+    x = np.random.RandomState(2).randn(delay - 5, 4)
+    y, __ = comb_filter(x, delay, gain, pole)
+    np.testing.assert_allclose(y, lfilter(b, a, x, axis=0), atol=1e-12)
+
+def test_comb_filtfilt_matches_filtfilt():
+    delay, gain, pole = comb_coefficients()
+    b, a = _dense_comb(delay, gain, pole)
+    rng = np.random.RandomState(3)
+    for n in [30, 500, 4001]:
+        x = rng.randn(n, 2)
+        padlen = min(3 * (delay + 1), n - 1)
+        np.testing.assert_allclose(comb_filtfilt(x, delay, gain, pole),
+                                   filtfilt(b, a, x, axis=0, padlen=padlen), atol=1e-12)
@@ -0,0 +1,43 @@
+# Authors: Agamemnon Krasoulis <agamemnon.krasoulis@gmail.com>
+
+from __future__ import division, print_function
+import numpy as np
+from pyEMG.wiener_filter import WienerFilter
+
+def _data(n_samples=400, num_feat=3, num_pred=2, seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(n_samples, num_feat)
+    Y = np.dot(X, rng.randn(num_feat, num_pred)) + 0.1 * rng.randn(n_samples, num_pred)
+    return X, Y
+
+def _partial_fit(model, X, Y, sizes):
+    """Passes X and Y to partial_fit in chunks of the given sizes (cycled)."""
+    start, ii = 0, 0
+    while start < X.shape[0]:
+        stop = start + sizes[ii % len(sizes)]
+        model.partial_fit(X[start:stop], Y[start:stop])
+        start, ii = stop, ii + 1
+    model.finalize()
+
+def test_partial_fit_matches_fit():
+    X, Y = _data()
+    num_lags = 5
+    batch = WienerFilter(3, 2, num_lags=num_lags)
+    batch.fit(X, Y)
+    # Chunks of one sample, shorter than num_lags and mixed lengths
+    for sizes in [[1], [num_lags - 2], [2, 1, num_lags, 17]]:
+        model = WienerFilter(3, 2, num_lags=num_lags)
+        _partial_fit(model, X, Y, sizes)
+        np.testing.assert_allclose(model.H, batch.H, atol=1e-10)
+        np.testing.assert_allclose(model.predict(X), batch.predict(X), atol=1e-10)
+
+def test_fit_discards_partial_fit_statistics():
+    X, Y = _data()
+    model = WienerFilter(3, 2, num_lags=3)
+    model.partial_fit(X[:100], Y[:100])
+    model.fit(X, Y)
+    model.partial_fit(X, Y)
+    model.finalize()
+    batch = WienerFilter(3, 2, num_lags=3)
+    batch.fit(X, Y)
+    np.testing.assert_allclose(model.H, batch.H, atol=1e-10)
@@ -1,7 +1,9 @@
 import numpy as np
-from scipy.linalg import toeplitz
-from scipy.signal import lfilter
+from scipy.linalg import cho_factor, cho_solve, eigh, LinAlgError
+from numpy.lib.stride_tricks import as_strided
 from pyEMG.metrics import vaf_score, vaf_mv_score
+from pyEMG.features_utils import lagged_crosscov
+from pyEMG.cross_validation import segment_data
 
 class WienerFilter(object):
     """Wiener Filter regression.
@@ -31,6 +33,11 @@ class WienerFilter(object):
         Standard deviation vector of input features.
     _output_lims : tuple, each element is array-like, shape = (num_pred,)
            Range of target signals.
+    _n_samples : int
+        Number of training samples.
+    _PX : array-like, shape = (num_feat*num_lags, num_feat*num_lags) or None
+        Covariance of the lagged inputs, only kept if the filter was fit
+        with keep_covariance=True (see AdaptiveWienerPredictor).
     metrics : Goodness of fit on training data
         metrics.vaf : Variance accounted for, for each target signal
         metrics.vaf_mv : Multivariate variance accounted for
@@ -92,23 +99,133 @@ class WienerFilter(object):
         return x
 
     def _covf(self, x,M):
+        """Lagged covariances of all channel pairs, computed with a single
+        batched FFT pass (see features_utils.lagged_crosscov). R[i+j*n_dim, k]
+        is the covariance of channels i and j at lag k."""
         n_sam, n_dim = np.shape(x)
-        x = np.vstack((x, np.zeros((M,n_dim))))
-        rows = np.arange(n_sam)
-        R = np.zeros((n_dim**2,M), dtype=float)
-        for jj in range(M):
-            a = np.dot(np.transpose(x[rows,:]), x[rows+jj,:])
-            R[:,jj] = (np.conj(a)/n_sam).reshape((n_dim**2), order = 'F')
+        r = lagged_crosscov(x, num_lags=M)
+        R = r.transpose((0, 2, 1)).reshape((M, n_dim**2)).T
         return R
 
 
-    def fit(self, X, Y):
+    def fit(self, X, Y, keep_covariance=False):
+        X, Y = self._check_X_Y(X, Y)
+        Y = self._prepare_output(Y)
+        PX, PXY = self._system(X, Y)
+
+        # Solve matrix equations to identify filters
+        self.H = self._solve(PX, PXY, self.reg_lambda)
+        self._n_samples = X.shape[0]
+        self._PX = PX if keep_covariance else None
+        # Statistics accumulated by partial_fit are discarded
+        self._stats = None
+
+    def fit_path(self, X, Y, reg_lambdas):
+        """Fits the filter for a grid of regularization values.
+
+        The normal equations are computed and eigendecomposed once, hence each
+        additional value of reg_lambda costs a single matrix product. H is
+        not modified.
+
+        Returns
+        -------
+
+        H_path : array, shape = (n_lambdas, num_feat*num_lags, num_pred)
+            Coefficient matrices, one for each value in reg_lambdas.
+        """
+        X, Y = self._check_X_Y(X, Y)
+        Y = self._prepare_output(Y)
+        PX, PXY = self._system(X, Y)
+        return self._solve_path(PX, PXY, reg_lambdas)
+
+    def fit_cv(self, X, Y, reg_lambdas, n_folds=5, cv=None, keep_covariance=False):
+        """Selects reg_lambda by cross-validation and fits the filter.
+
+        For each fold, the regularization path is computed (see fit_path)
+        and the multivariate VAF of the held-out data is evaluated for every
+        value of reg_lambda. The value with the highest average VAF is
+        selected and the filter is fit on all data.
+
+        Parameters
+        ----------
+
+        reg_lambdas : array-like
+            Candidate values of the regularization hyper-parameter.
+        n_folds : int
+            Number of contiguous folds, used if cv is not given.
+        cv : MovementCrossValidation, optional
+            Fitted cross-validation object defining the folds.
+        keep_covariance : boolean, optional (default False)
+            As in finalize.
+
+        Attributes
+        ----------
+
+        cv_vaf_mv : array, shape = (n_folds, n_lambdas)
+            Multivariate VAF of held-out data.
+        """
+        X, Y = self._check_X_Y(X, Y)
+        reg_lambdas = np.asarray(reg_lambdas, dtype=float).reshape(-1)
+        folds = self._cv_folds(X.shape[0], n_folds, cv)
+        # Statistics of the elementary segments between fold boundaries are
+        # computed once; those of each training set are merged from them
+        bounds = np.unique(np.hstack([0, X.shape[0]] + [train.ravel() for train, _ in folds]))
+        segments = [self._statistics(X[start:stop], Y[start:stop])
+                    for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.cv_vaf_mv = np.zeros((len(folds), reg_lambdas.size))
+        for fold, (train, test) in enumerate(folds):
+            model = WienerFilter(self.num_feat, self.num_pred, num_lags=self.num_lags)
+            stats = self._merge_statistics(segments, bounds, train)
+            PX, PXY = model._statistics_system(stats)
+            H_path = model._solve_path(PX, PXY, reg_lambdas)
+            X_test, Y_test = segment_data(X, test), segment_data(Y, test)
+            for ii, H in enumerate(H_path):
+                model.H = H
+                self.cv_vaf_mv[fold, ii] = vaf_mv_score(Y_test[self.num_lags-1:,:], model.predict(X_test))
+        self.reg_lambda = reg_lambdas[np.argmax(np.mean(self.cv_vaf_mv, axis=0))]
+        self._fit_statistics(self._merge_statistics(segments, bounds, [(0, X.shape[0])]),
+                             keep_covariance)
+
+    def _cv_folds(self, num_samples, n_folds, cv=None):
+        """Returns the training and testing (start, stop) segments of
+        cross-validation folds."""
+        if cv is not None:
+            return list(zip(cv.train_segments, cv.test_segments))
+        folds = []
+        # Contiguous folds, sized as by np.array_split
+        sizes = num_samples // n_folds + (np.arange(n_folds) < num_samples % n_folds)
+        edges = np.hstack(([0], np.cumsum(sizes)))
+        for start, stop in zip(edges[:-1], edges[1:]):
+            test = np.array([[start, stop]])
+            train = np.array([[0, start], [stop, num_samples]])
+            folds.append((train[train[:, 1] > train[:, 0]], test))
+        return folds
+
+    def _statistics(self, X, Y):
+        """Returns the sufficient statistics of contiguous data."""
+        return _LaggedStatistics(self.num_feat, self.num_pred, self.num_lags).update(X, Y)
+
+    def _merge_statistics(self, segments, bounds, runs):
+        """Returns the statistics of the concatenation of runs of data, where
+        each run (start, stop) is made up of elementary segments with
+        statistics segments[ii] covering samples bounds[ii]:bounds[ii+1]."""
+        stats = _LaggedStatistics(self.num_feat, self.num_pred, self.num_lags)
+        for start, stop in runs:
+            for ii in range(np.searchsorted(bounds, start), np.searchsorted(bounds, stop)):
+                stats.merge(segments[ii])
+        return stats
+
+    def _check_X_Y(self, X, Y):
         X = np.asarray(X)
         Y = np.asarray(Y)
         assert X.shape[1] == self.num_feat
         assert Y.shape[1] == self.num_pred
         assert X.shape[0] == Y.shape[0]
+        return X, Y
 
+    def _prepare_output(self, Y):
+        """Stores the range of the targets and returns them centered and
+        standardized."""
         # Store output minimum and maximum values
         self._output_range = np.max(Y, axis = 0) - np.min(Y, axis = 0)
         self._output_max = np.max(Y, axis = 0)
@@ -121,44 +238,79 @@ class WienerFilter(object):
 #        #  Center and standardize outputs
         Y = self._center_output(Y)
         Y = self._standardize_output(Y)
+        return Y
 
-        numio = self.total_io
+    def _system(self, X, Y):
+        """Normal equations of the training data (see _lagged_system)."""
         R =  self._covf(np.hstack((X,Y)),self.num_lags)
-        PHI = np.empty((2*self.num_lags-1,numio**2), dtype = float,  order='C')
-
-        for ii in range(numio):
-            for jj in range(numio):
-                PHI[:,ii+jj*numio] = np.hstack((R[jj+ii*numio,np.arange(self.num_lags-1,0,-1)], R[ii+jj*numio,:]))
-
-        Nxxr = np.arange(self.num_lags-1, 2*(self.num_lags-1)+1,1)
-        Nxxc = np.arange(self.num_lags-1,-1,-1)
-        Nxy = np.arange(self.num_lags-1, 2*(self.num_lags-1)+1)
-
-
-        # Solve matrix equations to identify filters
-        PX = np.empty((self.num_feat*self.num_lags,self.num_feat*self.num_lags), dtype=float, order='C')
-        for ii in range(self.num_feat):
-            for jj in range(self.num_feat):
-                c_start = ii*self.num_lags
-                c_end = (ii+1)*self.num_lags
-                r_start = jj*self.num_lags
-                r_end = (jj+1)*self.num_lags
-                PX[r_start:r_end,c_start:c_end] = toeplitz(PHI[Nxxc,ii+(jj)*numio],PHI[Nxxr,ii+(jj)*numio])
-
-        PXY = np.empty((self.num_feat*self.num_lags, self.num_pred), dtype=float, order='C')
-        for ii in range(self.num_feat):
-            for jj in range(self.num_feat,self.num_feat+self.num_pred,1):
-                r_start = ii*self.num_lags
-                r_end = (ii+1)*self.num_lags
-                c_ind = jj-self.num_feat
-                PXY[r_start:r_end,c_ind] = PHI[Nxy,ii+(jj)*numio]
-
-        self.H = np.linalg.solve((PX + self.reg_lambda*np.identity(PX.shape[0])), PXY)
-
-
-    def predict(self, X, online=False, normalizePrediction=False):
+        r = R.T.reshape((self.num_lags, self.total_io, self.total_io)).transpose((0, 2, 1))
+        return self._lagged_system(r[:, :self.num_feat, :self.num_feat],
+                                   r[:, :self.num_feat, self.num_feat:])
+
+    def _lagged_system(self, rxx, rxy):
+        """Assembles the block-Toeplitz normal equations from the lagged
+        covariances of the inputs, rxx[m,a,b] = E[x_a(t)x_b(t+m)], and of
+        the inputs with the outputs, rxy[m,a,b] = E[x_a(t)y_b(t+m)].
+
+        Returns PX, shape = (num_feat*num_lags, num_feat*num_lags), the
+        covariance of the lagged inputs and PXY, shape =
+        (num_feat*num_lags, num_pred), their covariance with the outputs.
+        Row ii*num_lags+p corresponds to feature ii delayed by p samples."""
+        M = self.num_lags
+        F = self.num_feat
+
+        # Input covariances at lags -(M-1),...,M-1
+        C = np.concatenate((rxx[:0:-1].transpose((0, 2, 1)), rxx))
+        lags = (M - 1) + np.arange(M)[np.newaxis, :] - np.arange(M)[:, np.newaxis]
+        PX = C[lags].transpose((3, 0, 2, 1)).reshape((F*M, F*M))
+        PXY = rxy.transpose((1, 0, 2)).reshape((F*M, self.num_pred))
+        return PX, PXY
+
+    def _statistics_system(self, stats):
+        """Normal equations from accumulated sufficient statistics (see
+        _LaggedStatistics). The range and the mean and standard deviation of
+        the targets are stored as in fit."""
+        self._output_max = stats.y_max
+        self._output_min = stats.y_min
+        self._output_range = stats.y_max - stats.y_min
+        self._output_mean = stats.y_mean
+        self._output_sigma = np.sqrt(stats.y_m2 / stats.n)
+        # Sums of inputs paired with a target at each lag (pairs must lie
+        # within the data), used for centering the targets
+        x_tail = stats.tail[:, :self.num_feat]
+        x_sums = np.array([stats.x_sum - np.sum(x_tail[max(0, x_tail.shape[0] - m):], axis=0)
+                           for m in range(self.num_lags)])
+        rxy = stats.cxy - x_sums[:, :, np.newaxis] * self._output_mean
+        rxy /= self._output_sigma * stats.n
+        return self._lagged_system(stats.cxx / stats.n, rxy)
+
+    def _solve(self, PX, PXY, reg_lambda):
+        """Solves the regularised normal equations by Cholesky factorization
+        (falls back to LU if the system is not positive definite)."""
+        A = PX + reg_lambda*np.identity(PX.shape[0])
+        try:
+            return cho_solve(cho_factor(A, lower=True), PXY)
+        except LinAlgError:
+            return np.linalg.solve(A, PXY)
+
+    def _solve_path(self, PX, PXY, reg_lambdas):
+        """Solves the normal equations for several values of reg_lambda with
+        a single eigendecomposition."""
+        w, V = eigh(PX)
+        B = np.dot(V.T, PXY)
+        reg_lambdas = np.asarray(reg_lambdas, dtype=float).reshape(-1)
+        # (PX + lambda*I)^-1 PXY = V diag(1/(w+lambda)) V' PXY
+        return np.matmul(V, B / (w[np.newaxis, :, np.newaxis] + reg_lambdas[:, np.newaxis, np.newaxis]))
+
+
+    def predict(self, X, online=False, normalizePrediction=False, chunk_size=None):
         """If batch is True, X.shape = (num_sam, num_feat), if not
-        X.shape = (num_lags, num_feat)."""
+        X.shape = (num_lags, num_feat).
+
+        In batch mode, the lagged input is a strided view of X and the output
+        is computed with one matrix product per chunk of chunk_size samples
+        (by default, chunks of about 1M lagged input values), hence memory
+        requirements do not depend on the length of X."""
         X = np.asarray(X)
         # If input array is single-dimensional, reshape it
         if X.ndim == 1:
@@ -175,14 +327,7 @@ class WienerFilter(object):
 #        X = self._standardize_input(X, self._input_sigma)
 
         if online is not True:
-            num_samples = X.shape[0]
-            Y = np.zeros((num_samples,self.num_pred))
-            for ii in range(self.num_pred):
-                for jj in range(self.num_feat):
-                    coef = self.H[jj*self.num_lags:(jj+1)*self.num_lags,ii]
-                    Y[:,ii] += lfilter(coef,1,X[:,jj], axis = -1)
-
-            Y = Y[self.num_lags-1:,:]
+            Y = self._predict_batch(X, chunk_size)
         else:
             X_ud = np.flipud(X)
             Y = np.dot(X_ud.reshape(-1, order='F'), self.H)
@@ -197,7 +342,338 @@ class WienerFilter(object):
 
         return Y
 
+    def _lagged_order(self):
+        """Returns the permutation of the rows of H (and of the normal
+        equations) to the order of a flattened window of the last num_lags
+        input samples, oldest first."""
+        rows = np.arange(self.num_feat * self.num_lags).reshape((self.num_feat, self.num_lags))
+        return rows[:, ::-1].T.reshape(-1)
+
+    def _lagged_coefficients(self):
+        """Returns H with rows ordered as a flattened window of the last
+        num_lags input samples (oldest first), shape =
+        (num_lags*num_feat, num_pred)."""
+        return self.H[self._lagged_order()]
+
+    def _predict_batch(self, X, chunk_size=None):
+        """Filters X with H. The first num_lags-1 samples, for which the
+        lagged input is incomplete, are not predicted."""
+        X = np.ascontiguousarray(X, dtype=float)
+        num_win = max(X.shape[0] - self.num_lags + 1, 0)
+        H = self._lagged_coefficients()
+        if chunk_size is None:
+            chunk_size = max(1, 2**20 // H.shape[0])
+        # Row t of the view is the flattened window X[t:t+num_lags]
+        windows = as_strided(X, shape=(num_win, H.shape[0]), strides=X.strides)
+        Y = np.empty((num_win, self.num_pred))
+        for start in range(0, num_win, chunk_size):
+            stop = min(start + chunk_size, num_win)
+            np.dot(windows[start:stop], H, out=Y[start:stop])
+        return Y
+
     def evaluate(self,X,Y):
         pred_training_data = self.predict(X)
         self.vaf = vaf_score(Y[self.num_lags-1:,:], pred_training_data)
         self.vaf_mv = vaf_mv_score(Y[self.num_lags-1:,:], pred_training_data)
+
+    def partial_fit(self, X, Y):
+        """Accumulates the sufficient statistics of a chunk of training data.
+
+        Consecutive chunks are treated as one continuous recording, i.e.
+        lagged products across chunk boundaries are included, so the result
+        of finalize() is the same as that of fit() on the concatenated data.
+        Only statistics of size O(num_lags*num_feat*(num_feat+num_pred))
+        are kept between calls. They are discarded by fit() or
+        reset_statistics().
+        """
+        X, Y = self._check_X_Y(X, Y)
+        if getattr(self, '_stats', None) is None:
+            self._stats = _LaggedStatistics(self.num_feat, self.num_pred, self.num_lags)
+        self._stats.update(X, Y)
+
+    def finalize(self, keep_covariance=False):
+        """Solves the normal equations of the data passed to partial_fit.
+        More data can be added afterwards.
+
+        If keep_covariance is True, the covariance of the lagged inputs is
+        kept for initialising an AdaptiveWienerPredictor (as in fit).
+        """
+        if getattr(self, '_stats', None) is None:
+            raise ValueError('No data accumulated: call partial_fit first.')
+        self._fit_statistics(self._stats, keep_covariance)
+
+    def reset_statistics(self):
+        """Discards the data accumulated by partial_fit (the coefficients
+        are not modified)."""
+        self._stats = None
+
+    def _fit_statistics(self, stats, keep_covariance=False):
+        PX, PXY = self._statistics_system(stats)
+        self.H = self._solve(PX, PXY, self.reg_lambda)
+        self._n_samples = stats.n
+        self._PX = PX if keep_covariance else None
+
+class _LaggedStatistics(object):
+    """Sufficient statistics of the Wiener filter normal equations.
+
+    Statistics of consecutive pieces of data are combined with merge(). The
+    first and last num_lags-1 samples of the data are kept, so that lagged
+    products across the junction can be added.
+
+    Attributes
+    ----------
+
+    n : int
+        Number of samples.
+    cxx : array, shape = (num_lags, num_feat, num_feat)
+        Lagged input products, cxx[m,a,b] = sum_t x_a(t)x_b(t+m).
+    cxy : array, shape = (num_lags, num_feat, num_pred)
+        Lagged input-target products, cxy[m,a,b] = sum_t x_a(t)y_b(t+m).
+    x_sum : array, shape = (num_feat,)
+        Sum of inputs.
+    y_mean, y_m2 : array, shape = (num_pred,)
+        Mean and sum of squared deviations of targets.
+    y_min, y_max : array, shape = (num_pred,)
+        Range of targets.
+    head, tail : array, shape = (<= num_lags-1, num_feat+num_pred)
+        First and last samples of the data (inputs and targets).
+    """
+
+    def __init__(self, num_feat, num_pred, num_lags):
+        self.num_feat = num_feat
+        self.num_lags = num_lags
+        self.n = 0
+        self.cxx = np.zeros((num_lags, num_feat, num_feat))
+        self.cxy = np.zeros((num_lags, num_feat, num_pred))
+        self.x_sum = np.zeros(num_feat)
+        self.y_mean = np.zeros(num_pred)
+        self.y_m2 = np.zeros(num_pred)
+        self.y_min = np.full(num_pred, np.inf)
+        self.y_max = np.full(num_pred, -np.inf)
+        self.head = np.zeros((0, num_feat + num_pred))
+        self.tail = np.zeros((0, num_feat + num_pred))
+
+    def update(self, X, Y):
+        """Appends a chunk of data."""
+        other = _LaggedStatistics(self.num_feat, Y.shape[1], self.num_lags)
+        other.n = X.shape[0]
+        other.cxx = lagged_crosscov(X, X, self.num_lags, normalize=False)
+        other.cxy = lagged_crosscov(X, Y, self.num_lags, normalize=False)
+        other.x_sum = np.sum(X, axis=0)
+        other.y_mean = np.mean(Y, axis=0)
+        other.y_m2 = np.sum((Y - other.y_mean)**2, axis=0)
+        other.y_min = np.min(Y, axis=0)
+        other.y_max = np.max(Y, axis=0)
+        k = self.num_lags - 1
+        other.head = np.hstack((X[:k], Y[:k]))
+        if k > 0:
+            start = max(0, X.shape[0] - k)
+            other.tail = np.hstack((X[start:], Y[start:]))
+        return self.merge(other)
+
+    def merge(self, other):
+        """Appends the statistics of data following those of self."""
+        F = self.num_feat
+        k = self.num_lags - 1
+        if self.tail.shape[0] > 0 and other.head.shape[0] > 0:
+            # Products of pairs across the junction
+            z = np.vstack((self.tail, other.head))
+            for part, sign in [(z, 1.), (self.tail, -1.), (other.head, -1.)]:
+                self.cxx += sign * lagged_crosscov(part[:, :F], part[:, :F], self.num_lags, normalize=False)
+                self.cxy += sign * lagged_crosscov(part[:, :F], part[:, F:], self.num_lags, normalize=False)
+        self.cxx += other.cxx
+        self.cxy += other.cxy
+        n = self.n + other.n
+        delta = other.y_mean - self.y_mean
+        self.y_m2 = self.y_m2 + other.y_m2 + delta**2 * self.n * other.n / n
+        self.y_mean = self.y_mean + delta * other.n / n
+        self.x_sum = self.x_sum + other.x_sum
+        self.y_min = np.minimum(self.y_min, other.y_min)
+        self.y_max = np.maximum(self.y_max, other.y_max)
+        self.head = np.vstack((self.head, other.head))[:k]
+        if k > 0:
+            tail = np.vstack((self.tail, other.tail))
+            self.tail = tail[max(0, tail.shape[0] - k):]
+        self.n = n
+        return self
+
+class OnlineWienerPredictor(object):
+    """Streaming predictor for a fitted WienerFilter.
+
+    The last num_lags feature vectors are kept in a ring buffer (each sample
+    is stored twice so that the current window is always a contiguous view)
+    and the coefficients are permuted once to the layout of that window. Each
+    tick is then a single dot product written into a preallocated output.
+
+    Parameters
+    ----------
+
+    model : WienerFilter
+        Fitted Wiener filter.
+
+    normalizePrediction : boolean, optional (default False)
+        If True, predictions are scaled to the range of training targets and
+        thresholded in range [0,1], as in WienerFilter.predict.
+
+    Attributes
+    ----------
+
+    H_ : array, shape = (num_lags*num_feat, num_pred)
+        Coefficient matrix, rows ordered oldest lag first.
+
+    y_ : array, shape = (num_pred,)
+        Most recent prediction. It is overwritten at every tick.
+    """
+
+    def __init__(self, model, normalizePrediction=False):
+        self.num_feat = model.num_feat
+        self.num_pred = model.num_pred
+        self.num_lags = model.num_lags
+        self.normalizePrediction = normalizePrediction
+        self.H_ = np.ascontiguousarray(model._lagged_coefficients())
+        # De-normalization (and optional scaling) as y*_scale + _offset
+        self._scale = np.array(model._output_sigma, dtype=float)
+        self._offset = np.array(model._output_mean, dtype=float)
+        if normalizePrediction:
+            output_range = model._output_max - model._output_min
+            self._scale /= output_range
+            self._offset = (self._offset - model._output_min) / output_range
+        self._ring = np.zeros((2*self.num_lags, self.num_feat))
+        self._pos = 0
+        self.y_ = np.zeros(self.num_pred)
+
+    def reset(self):
+        """Clears the lag buffer (past inputs are taken as zeros)."""
+        self._ring.fill(0.)
+        self._pos = 0
+
+    def _push(self, x):
+        """Stores a new feature vector and returns the current window (oldest
+        sample first) as a flat view."""
+        self._ring[self._pos] = x
+        self._ring[self._pos + self.num_lags] = x
+        self._pos = (self._pos + 1) % self.num_lags
+        return self._ring[self._pos:self._pos + self.num_lags].reshape(-1)
+
+    def predict(self, x):
+        """Predicts the outputs for a new feature vector.
+
+        Parameters
+        ----------
+
+        x : array, shape = (num_feat,)
+            Most recent feature vector.
+
+        Returns
+        -------
+
+        y : array, shape = (num_pred,)
+            Prediction (the y_ attribute, overwritten at the next tick).
+        """
+        window = self._push(x)
+        np.dot(window, self.H_, out=self.y_)
+        np.multiply(self.y_, self._scale, out=self.y_)
+        np.add(self.y_, self._offset, out=self.y_)
+        if self.normalizePrediction:
+            np.clip(self.y_, 0., 1., out=self.y_)
+        return self.y_
+
+
+class AdaptiveWienerPredictor(OnlineWienerPredictor):
+    """Streaming predictor that adapts the coefficients of a fitted
+    WienerFilter by recursive least squares (RLS).
+
+    Each update costs O((num_lags*num_feat)**2) operations, independent of
+    the amount of data seen, and uses preallocated buffers only. The
+    inverse correlation matrix is initialised from the regularized normal
+    equations of the training data, so that adaptation starts from the
+    fitted filter with the weight of 1/(1-forgetting_factor) samples (of
+    all training samples if forgetting_factor is 1). The model must have
+    been fit with keep_covariance=True, so that the covariance of the
+    training inputs is available.
+
+    Parameters
+    ----------
+
+    model : WienerFilter
+        Fitted Wiener filter (with keep_covariance=True).
+
+    forgetting_factor : float, optional (default 0.999)
+        Exponential weight of past samples, in (0, 1].
+
+    normalizePrediction : boolean, optional (default False)
+        As in OnlineWienerPredictor.
+
+    Attributes
+    ----------
+
+    P_ : array, shape = (num_lags*num_feat, num_lags*num_feat)
+        Inverse of the (weighted) correlation matrix of lagged inputs.
+    """
+
+    def __init__(self, model, forgetting_factor=0.999, normalizePrediction=False):
+        if not 0. < forgetting_factor <= 1.:
+            raise ValueError('forgetting_factor must be in (0, 1].')
+        PX = getattr(model, '_PX', None)
+        if PX is None:
+            raise ValueError('The covariance of the training inputs is not '
+                             'available: refit the model with '
+                             'keep_covariance=True.')
+        super(AdaptiveWienerPredictor, self).__init__(model, normalizePrediction)
+        self.forgetting_factor = forgetting_factor
+        self._target_mean = np.array(model._output_mean, dtype=float)
+        self._target_sigma = np.array(model._output_sigma, dtype=float)
+        n = self.H_.shape[0]
+        if forgetting_factor < 1.:
+            n_eff = 1. / (1. - forgetting_factor)
+        else:
+            n_eff = float(getattr(model, '_n_samples', 1))
+        order = model._lagged_order()
+        PX = PX[order][:, order]
+        self.P_ = np.linalg.inv((PX + model.reg_lambda * np.eye(n)) * n_eff)
+        self._gain = np.empty(n)
+        self._Pw = np.empty(n)
+        self._error = np.empty(self.num_pred)
+        self._dH = np.empty_like(self.H_)
+        self._dP = np.empty_like(self.P_)
+
+    def update(self, x, y):
+        """Predicts the outputs for a new feature vector and updates the
+        coefficients with the observed targets.
+
+        Parameters
+        ----------
+
+        x : array, shape = (num_feat,)
+            Most recent feature vector (replaces a call to predict).
+
+        y : array, shape = (num_pred,)
+            Observed targets for x, in their original scale.
+
+        Returns
+        -------
+
+        y : array, shape = (num_pred,)
+            Prediction before the update (the y_ attribute).
+        """
+        window = self._push(x)
+        # A priori error in normalized units
+        np.dot(window, self.H_, out=self.y_)
+        np.subtract(y, self._target_mean, out=self._error)
+        np.divide(self._error, self._target_sigma, out=self._error)
+        np.subtract(self._error, self.y_, out=self._error)
+        # Gain and coefficient update
+        np.dot(self.P_, window, out=self._Pw)
+        np.divide(self._Pw, self.forgetting_factor + np.dot(window, self._Pw), out=self._gain)
+        np.multiply(self._gain[:, np.newaxis], self._error, out=self._dH)
+        self.H_ += self._dH
+        # Inverse correlation update
+        np.multiply(self._gain[:, np.newaxis], self._Pw, out=self._dP)
+        self.P_ -= self._dP
+        self.P_ /= self.forgetting_factor
+        # De-normalize the a priori prediction
+        np.multiply(self.y_, self._scale, out=self.y_)
+        np.add(self.y_, self._offset, out=self.y_)
+        if self.normalizePrediction:
+            np.clip(self.y_, 0., 1., out=self.y_)
+        return self.y_